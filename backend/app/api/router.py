@@ -3,9 +3,11 @@
 from app.api.routes.documents import router as documents_router
 from app.api.routes.search import router as search_router
 from app.api.routes.chat import router as chat_router
+from app.api.routes.index import router as index_router
 
 
 api_router = APIRouter()
 api_router.include_router(documents_router, prefix="/v1", tags=["documents"])
 api_router.include_router(search_router, prefix="/v1", tags=["search"])
 api_router.include_router(chat_router, prefix="/v1", tags=["chat"])
+api_router.include_router(index_router, prefix="/v1", tags=["index"])
@@ -1,16 +1,22 @@
 ﻿from __future__ import annotations
 
 import time
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
 from app.db.deps import get_db
+from app.services.admission import BATCH, INTERACTIVE, Overloaded, get_gate, request_deadline, request_priority
 from app.api.routes.search import search_chunks, SearchRequest, SearchResponse
 from app.services.llm import generate, get_provider
+from app.services.reranker import get_rerank_keep, is_rerank_enabled
+from app.services.metrics import get_profile, observe_stage, stage
+from app.services.snippets import compile_query, make_snippet
 
 import json
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from app.services.llm import generate_stream_ollama
 from app.services.llm import get_ollama_model
 
@@ -36,11 +42,13 @@ class ChatResponse(BaseModel):
     model: str
     latency_ms: int
     citations: list[Citation]
+    rerank_ms: int | None = None
+    prompt_chars: int = 0
 
 MAX_CHUNK_CHARS = 900          # on tronque chaque chunk pour éviter des prompts énormes
 MAX_UNIQUE_HITS = 5            # garde le top-k mais après déduplication
 
-def dedupe_hits(hits):
+def dedupe_hits(hits, limit: int = MAX_UNIQUE_HITS):
     """
     Déduplique des hits qui ont le même contenu (souvent fichiers uploadés plusieurs fois).
     On déduplique sur un hash simple du texte tronqué + filename.
@@ -53,10 +61,41 @@ def dedupe_hits(hits):
             continue
         seen.add(key)
         unique.append(h)
-        if len(unique) >= MAX_UNIQUE_HITS:
+        if len(unique) >= limit:
             break
     return unique
 
+def retrieve(question: str, top_k: int, db: Session) -> SearchResponse:
+    """
+    Recherche + dédup. Avec le re-ranking, on garde moins de blocs (RERANK_KEEP) dans le prompt.
+    """
+    retrieved = search_chunks(SearchRequest(query=question, top_k=top_k, rerank=is_rerank_enabled()), db=db)
+    limit = min(MAX_UNIQUE_HITS, get_rerank_keep()) if retrieved.reranked else MAX_UNIQUE_HITS
+    retrieved.hits = dedupe_hits(retrieved.hits, limit=limit)  # on réutilise la même liste partout (prompt + citations)
+    return retrieved
+
+def overloaded(e: Overloaded) -> HTTPException:
+    # fast 503: better than a request that times out after queueing for minutes
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+async def admitted_retrieve(question: str, top_k: int, db: Session, priority: int, deadline: float) -> SearchResponse:
+    """
+    Embedding and search are CPU-bound: limited by the retrieval gate, and run in
+    a thread so the event loop keeps serving (and rejecting) other requests.
+    """
+    try:
+        async with get_gate("retrieval").slot(priority, deadline):
+            retrieved = await run_in_threadpool(retrieve, question, top_k, db)
+    except Overloaded as e:
+        raise overloaded(e) from None
+    # hits are plain models: give the connection back to the pool before waiting for the LLM
+    db.close()
+    return retrieved
+
+def is_weak(retrieved: SearchResponse) -> bool:
+    # après re-ranking, hits[0] n'est plus forcément le meilleur score cosinus
+    return not retrieved.hits or max(h.score for h in retrieved.hits) < 0.15
+
 def build_prompt(question: str, retrieved: SearchResponse) -> str:
     if not retrieved.hits:
         return (
@@ -95,88 +134,50 @@ def build_prompt(question: str, retrieved: SearchResponse) -> str:
     )
 
 
-import re
-
-STOPWORDS = {
-    "c", "ce", "cet", "cette", "ces",
-    "est", "quoi", "que", "qui", "comment", "pourquoi",
-    "un", "une", "des", "le", "la", "les",
-    "de", "du", "d", "a", "au", "aux", "en", "pour", "sur",
-}
-
-def make_snippet(text: str, query: str, window: int = 240) -> str:
-    raw = re.findall(r"[A-Za-z0-9]+", query)
-    tokens = []
-    for t in raw:
-        tl = t.lower()
-        if len(t) < 3:
-            continue
-        if tl in STOPWORDS:
-            continue
-        tokens.append(t)
-
-    # dédoublonnage + priorisation:
-    # 1) tokens avec chiffres ou acronyme (BM25, RAG, FAISS)
-    # 2) tokens longs
-    uniq = list(dict.fromkeys(tokens))  # garde l'ordre
-    def score(t: str) -> tuple[int, int]:
-        has_digit = any(ch.isdigit() for ch in t)
-        is_acronym = t.isupper()
-        return (1 if (has_digit or is_acronym) else 0, len(t))
-
-    uniq.sort(key=lambda t: score(t), reverse=True)
-
-    lower = text.lower()
-    for tok in uniq:
-        i = lower.find(tok.lower())
-        if i != -1:
-            start = max(0, i - window // 2)
-            end = min(len(text), start + window)
-            snippet = text[start:end]
-            if start > 0:
-                snippet = "…" + snippet
-            if end < len(text):
-                snippet = snippet + "…"
-            return snippet
-
-    # fallback
-    return (text[:window] + "…") if len(text) > window else text
-
-
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(payload: ChatRequest, db: Session = Depends(get_db)) -> ChatResponse:
+async def chat(
+    payload: ChatRequest,
+    db: Session = Depends(get_db),
+    x_priority: str | None = Header(default=None),
+) -> ChatResponse:
     question = payload.question
     t0 = time.time()
+    priority = request_priority(x_priority, BATCH)
+    deadline = request_deadline()  # shared by both stages
 
-    retrieved = search_chunks(SearchRequest(query=question, top_k=payload.top_k), db=db)
-
-    hits = dedupe_hits(retrieved.hits)
-    retrieved.hits = hits  # on réutilise la même liste partout (prompt + citations)
+    retrieved = await admitted_retrieve(question, payload.top_k, db, priority, deadline)
 
     # Guardrail: if no hits, don't call LLM (saves time/cost)
-    if not retrieved.hits or retrieved.hits[0].score < 0.15:
+    if is_weak(retrieved):
         return ChatResponse(
             answer="Je n'ai pas assez d'information dans les documents fournis pour répondre.",
             provider=get_provider(),
             model="n/a",
             latency_ms=int((time.time() - t0) * 1000),
             citations=[],
+            rerank_ms=retrieved.rerank_ms,
         )
 
-    prompt = build_prompt(payload.question, retrieved)
+    with stage("prompt_build"):
+        prompt = build_prompt(payload.question, retrieved)
 
     provider = get_provider()
     try:
-        answer, used_model = await generate(provider, prompt)
+        async with get_gate("llm").slot(priority, deadline):
+            with stage("llm_generation"):
+                answer, used_model = await generate(provider, prompt)
+    except Overloaded as e:
+        raise overloaded(e) from None
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    # Build citations with short snippets (first 240 chars)
+    # Build citations with short snippets (240 chars around the query terms)
     citations: list[Citation] = []
 
+    terms = compile_query(question)  # once for all hits
     for h in retrieved.hits:
-        snippet = make_snippet(h.text, question, window=240)
+        snippet = make_snippet(h.text, terms, window=240)
 
         citations.append(
             Citation(
@@ -196,29 +197,38 @@ async def chat(payload: ChatRequest, db: Session = Depends(get_db)) -> ChatRespo
         model=used_model,
         latency_ms=int((time.time() - t0) * 1000),
         citations=citations,
+        rerank_ms=retrieved.rerank_ms,
+        prompt_chars=len(prompt),
     )
 
 @router.get("/chat/stream")
-async def chat_stream(question: str, top_k: int = 5, db: Session = Depends(get_db)):
+async def chat_stream(
+    question: str,
+    top_k: int = 5,
+    db: Session = Depends(get_db),
+    x_priority: str | None = Header(default=None),
+):
     t0 = time.time()
+    priority = request_priority(x_priority, INTERACTIVE)
+    deadline = request_deadline()
 
-    retrieved = search_chunks(SearchRequest(query=question, top_k=top_k), db=db)
-    hits = dedupe_hits(retrieved.hits)
-    retrieved.hits = hits
+    retrieved = await admitted_retrieve(question, top_k, db, priority, deadline)
 
     # Guardrail
-    if not retrieved.hits or retrieved.hits[0].score < 0.15:
+    if is_weak(retrieved):
         async def gen():
             yield "event: token\ndata: " + json.dumps({"text": "Je n'ai pas assez d'information dans les documents fournis pour répondre."}) + "\n\n"
             yield "event: done\ndata: {}\n\n"
         return StreamingResponse(gen(), media_type="text/event-stream")
 
-    prompt = build_prompt(question, retrieved)
+    with stage("prompt_build"):
+        prompt = build_prompt(question, retrieved)
 
     # Build citations (same logic as /chat)
     citations = []
+    terms = compile_query(question)
     for h in retrieved.hits:
-        snippet = make_snippet(h.text, question, window=240)
+        snippet = make_snippet(h.text, terms, window=240)
 
         citations.append(
             {
@@ -232,25 +242,48 @@ async def chat_stream(question: str, top_k: int = 5, db: Session = Depends(get_d
             }
         )
 
+    # the body runs after the endpoint returned: keep a handle on the request's profile
+    profile = get_profile()
+
+    # admitted before the response starts, so a rejection can still be a 503
+    try:
+        slot = await get_gate("llm").acquire(priority, deadline)
+    except Overloaded as e:
+        raise overloaded(e) from None
+
     async def event_gen():
         # stream tokens
-        async for tok in generate_stream_ollama(prompt):
-            yield "event: token\ndata: " + json.dumps({"text": tok}) + "\n\n"
+        t_gen = time.perf_counter()
+        first = True
+        try:
+            async for tok in generate_stream_ollama(prompt):
+                if first:
+                    observe_stage("llm_ttft", time.perf_counter() - t_gen, profile)
+                    first = False
+                yield "event: token\ndata: " + json.dumps({"text": tok}) + "\n\n"
+        finally:
+            slot.release()
+        observe_stage("llm_generation", time.perf_counter() - t_gen, profile)
 
         latency_ms = int((time.time() - t0) * 1000)
-        yield "event: meta\ndata: " + json.dumps(
-            {
-                "provider": "ollama",
-                "model": get_ollama_model(),
-                "latency_ms": latency_ms,
-                "citations": citations,
-            }
-        ) + "\n\n"
+        meta = {
+            "provider": "ollama",
+            "model": get_ollama_model(),
+            "latency_ms": latency_ms,
+            "rerank_ms": retrieved.rerank_ms,
+            "prompt_chars": len(prompt),
+            "citations": citations,
+        }
+        if profile is not None:
+            # headers are already sent: the stage breakdown goes with the meta event
+            meta["timings_ms"] = {name: round(ms, 1) for name, ms in profile.items()}
+        yield "event: meta\ndata: " + json.dumps(meta) + "\n\n"
         yield "event: done\ndata: {}\n\n"
 
     return StreamingResponse(
         event_gen(),
         media_type="text/event-stream",
+        background=BackgroundTask(slot.release),  # if the body never started (client gone)
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
@@ -1,15 +1,21 @@
 ﻿from __future__ import annotations
 
+import base64
+import json
 import re
 import uuid
+from collections.abc import Iterator
 from pathlib import Path
 import datetime as dt
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, ConfigDict
-from sqlalchemy import select
+from sqlalchemy import and_, or_, select
 from sqlalchemy.orm import Session
 
+from app.db.database import SessionLocal
 from app.db.deps import get_db
 from app.db.models import Document
 
@@ -17,10 +23,8 @@ from app.db.models import Document, Chunk
 from app.services.parsing import extract_text_from_txt
 from app.services.chunking import chunk_text
 
-from app.db.models import ChunkVector
-from app.services.embeddings import embed_texts, DEFAULT_MODEL
-from app.services.faiss_index import load_or_create_index, save_index, add_vectors
-import numpy as np
+from app.services.embeddings import get_active_model
+from app.services.indexing import index_chunks
 
 router = APIRouter()
 
@@ -96,10 +100,71 @@ async def upload_document(
 
     return doc
 
+def encode_cursor(values: list) -> str:
+    # opaque to clients: the keyset position of the last row returned
+    raw = json.dumps(jsonable_encoder(values)).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, *types: type) -> list:
+    # one value per type; a tampered cursor is a 400, never a 500 in the query
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(types):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # type() rather than isinstance(): true/false are not chunk indexes
+    if any(type(v) is not t for v, t in zip(values, types)):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def parse_fields(fields: str | None, model: type[BaseModel]) -> list[str]:
+    allowed = list(model.model_fields)
+    if not fields:
+        return allowed
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+def page_response(rows: list[dict], next_cursor: str | None) -> JSONResponse:
+    # a plain list keeps existing clients working; the next page is in a header
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return JSONResponse(content=jsonable_encoder(rows), headers=headers)
+
 @router.get("/documents", response_model=list[DocumentOut])
-def list_documents(db: Session = Depends(get_db)) -> list[Document]:
-    stmt = select(Document).order_by(Document.created_at.desc())
-    return db.scalars(stmt).all()
+def list_documents(
+    limit: int | None = Query(default=None, ge=1, le=1000),
+    cursor: str | None = None,
+    fields: str | None = Query(default=None, description="Comma-separated subset of fields"),
+    db: Session = Depends(get_db),
+) -> JSONResponse:
+    """
+    Newest first. With `limit`, pages are chained with the X-Next-Cursor response header.
+    """
+    selected = parse_fields(fields, DocumentOut)
+    stmt = select(Document.created_at, Document.id, *[getattr(Document, f) for f in selected])
+    if cursor:
+        created_at, doc_id = decode_cursor(cursor, str, str)
+        try:
+            created_at = dt.datetime.fromisoformat(created_at)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        stmt = stmt.where(
+            or_(
+                Document.created_at < created_at,
+                and_(Document.created_at == created_at, Document.id < doc_id),
+            )
+        )
+    stmt = stmt.order_by(Document.created_at.desc(), Document.id.desc())
+    if limit:
+        stmt = stmt.limit(limit)
+
+    rows = db.execute(stmt).all()
+    next_cursor = encode_cursor([rows[-1][0], rows[-1][1]]) if limit and len(rows) == limit else None
+    return page_response([dict(zip(selected, r[2:])) for r in rows], next_cursor)
 
 class ChunkOut(BaseModel):
     model_config = ConfigDict(from_attributes=True)
@@ -110,10 +175,61 @@ class ChunkOut(BaseModel):
     start_char: int | None
     end_char: int | None
 
+def chunks_query(doc_id: str, selected: list[str]):
+    # served by the (document_id, chunk_index) index; text is only read when selected
+    return (
+        select(Chunk.chunk_index, *[getattr(Chunk, f) for f in selected])
+        .where(Chunk.document_id == doc_id)
+        .order_by(Chunk.chunk_index.asc())
+    )
+
 @router.get("/documents/{doc_id}/chunks", response_model=list[ChunkOut])
-def list_chunks(doc_id: str, db: Session = Depends(get_db)) -> list[Chunk]:
-    stmt = select(Chunk).where(Chunk.document_id == doc_id).order_by(Chunk.chunk_index.asc())
-    return db.scalars(stmt).all()
+def list_chunks(
+    doc_id: str,
+    limit: int | None = Query(default=None, ge=1, le=1000),
+    cursor: str | None = None,
+    fields: str | None = Query(default=None, description="Comma-separated subset of fields, e.g. without text"),
+    db: Session = Depends(get_db),
+) -> JSONResponse:
+    """
+    In chunk order. With `limit`, pages are chained with the X-Next-Cursor response header.
+    """
+    selected = parse_fields(fields, ChunkOut)
+    stmt = chunks_query(doc_id, selected)
+    if cursor:
+        (after,) = decode_cursor(cursor, int)
+        stmt = stmt.where(Chunk.chunk_index > after)
+    if limit:
+        stmt = stmt.limit(limit)
+
+    rows = db.execute(stmt).all()
+    next_cursor = encode_cursor([rows[-1][0]]) if limit and len(rows) == limit else None
+    return page_response([dict(zip(selected, r[1:])) for r in rows], next_cursor)
+
+@router.get("/documents/{doc_id}/chunks/export")
+def export_chunks(
+    doc_id: str,
+    fields: str | None = Query(default=None, description="Comma-separated subset of fields"),
+    db: Session = Depends(get_db),
+) -> StreamingResponse:
+    """
+    All chunks of a document as NDJSON, streamed in batches instead of built in memory.
+    """
+    if db.get(Document, doc_id) is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    selected = parse_fields(fields, ChunkOut)
+
+    def rows() -> Iterator[bytes]:
+        # own session: the request's one may be closed while the body is still streaming
+        session = SessionLocal()
+        try:
+            result = session.execute(chunks_query(doc_id, selected).execution_options(yield_per=500))
+            for r in result:
+                yield json.dumps(jsonable_encoder(dict(zip(selected, r[1:]))), ensure_ascii=False).encode("utf-8") + b"\n"
+        finally:
+            session.close()
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
 
 @router.post("/documents/{doc_id}/index")
 def index_document(doc_id: str, db: Session = Depends(get_db)) -> dict[str, int]:
@@ -150,24 +266,4 @@ def index_document(doc_id: str, db: Session = Depends(get_db)) -> dict[str, int]
         if not chunks:
             raise HTTPException(status_code=404, detail="No chunks found for document")
 
-    # Filter already indexed chunks
-    existing = db.scalars(select(ChunkVector.chunk_id).where(ChunkVector.chunk_id.in_([c.id for c in chunks]))).all()
-    existing_set = set(existing)
-    to_index = [c for c in chunks if c.id not in existing_set]
-
-    if not to_index:
-        return {"indexed": 0}
-
-    texts = [c.text for c in to_index]
-    vectors = embed_texts(texts, model_name=DEFAULT_MODEL)
-
-    dim = len(vectors[0])
-    index = load_or_create_index(dim)
-    faiss_ids = add_vectors(index, vectors)
-    save_index(index)
-
-    for c, fid in zip(to_index, faiss_ids, strict=True):
-        db.add(ChunkVector(chunk_id=c.id, faiss_id=fid, embedding_model=DEFAULT_MODEL))
-
-    db.commit()
-    return {"indexed": len(to_index)}
+    return {"indexed": index_chunks(db, chunks, get_active_model())}
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+
+from app.db.database import SessionLocal
+from app.db.deps import get_db
+from app.services.embeddings import get_active_model, get_allowed_models
+from app.services.indexing import index_status, reembed_all
+
+router = APIRouter()
+
+# models currently being re-embedded in the background
+_running: set[str] = set()
+
+class ReembedRequest(BaseModel):
+    model: str = Field(min_length=1, max_length=200)
+    batch_size: int = Field(default=256, ge=1, le=4096)
+
+class IndexStatus(BaseModel):
+    active_model: str
+    total_chunks: int
+    indexed: dict[str, int]
+    running: list[str]
+
+def _run_reembed(model_name: str, batch_size: int) -> None:
+    db = SessionLocal()
+    try:
+        reembed_all(db, model_name, batch_size=batch_size)
+    finally:
+        db.close()
+        _running.discard(model_name)
+
+@router.post("/index/reembed", status_code=202)
+def reembed(payload: ReembedRequest, background: BackgroundTasks) -> dict[str, str]:
+    """
+    Re-embed every chunk with another model into its own index, without touching the live one.
+    Once /index/status shows it complete, switch EMBEDDING_MODEL and restart.
+    """
+    if payload.model not in get_allowed_models():
+        raise HTTPException(status_code=400, detail="Model not allowed: add it to EMBEDDING_MODELS")
+    if payload.model in _running:
+        raise HTTPException(status_code=409, detail="Re-embed already running for this model")
+    _running.add(payload.model)
+    background.add_task(_run_reembed, payload.model, payload.batch_size)
+    return {"status": "started", "model": payload.model}
+
+@router.get("/index/status", response_model=IndexStatus)
+def status(db: Session = Depends(get_db)) -> IndexStatus:
+    total, indexed = index_status(db)
+    return IndexStatus(
+        active_model=get_active_model(),
+        total_chunks=total,
+        indexed=indexed,
+        running=sorted(_running),
+    )
@@ -1,7 +1,6 @@
 ﻿from __future__ import annotations
 
 import datetime as dt
-from pathlib import Path
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
@@ -9,15 +8,18 @@ from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.db.deps import get_db
-from app.db.models import Chunk, ChunkVector, Document
-from app.services.embeddings import embed_query, DEFAULT_MODEL
-from app.services.faiss_index import load_or_create_index, search as faiss_search
+from app.db.models import Chunk, Document
+from app.services.embeddings import embed_query, get_active_model
+from app.services.faiss_index import get_index, index_exists
+from app.services.metrics import stage
+from app.services.reranker import get_rerank_candidates, rerank_scores
 
 router = APIRouter()
 
 class SearchRequest(BaseModel):
     query: str = Field(min_length=1, max_length=2000)
     top_k: int = Field(default=5, ge=1, le=20)
+    rerank: bool = False
 
 class SearchHit(BaseModel):
     score: float
@@ -29,82 +31,85 @@ class SearchHit(BaseModel):
     start_char: int | None
     end_char: int | None
     created_at: dt.datetime
+    rerank_score: float | None = None
 
 class SearchResponse(BaseModel):
     query: str
     top_k: int
     embedding_model: str
     hits: list[SearchHit]
+    reranked: bool = False
+    rerank_ms: int | None = None
 
 @router.post("/search", response_model=SearchResponse)
 def search_chunks(payload: SearchRequest, db: Session = Depends(get_db)) -> SearchResponse:
+    model_name = get_active_model()
+
     # Ensure FAISS index exists
-    index_path = Path("data") / "faiss.index"
-    if not index_path.exists():
+    if not index_exists(model_name):
         raise HTTPException(status_code=400, detail="FAISS index not found. Index at least one document first.")
 
     # Embed query
-    qvec = embed_query(payload.query, model_name=DEFAULT_MODEL)
-
-    # Load index (dim inferred from vector)
-    index = load_or_create_index(dim=len(qvec))
-    faiss_ids, scores = faiss_search(index, qvec, top_k=payload.top_k)
+    with stage("embed"):
+        qvec = embed_query(payload.query, model_name=model_name)
 
-    # FAISS returns -1 when not enough vectors exist
-    pairs = [(fid, sc) for fid, sc in zip(faiss_ids, scores) if fid is not None and fid >= 0]
-    if not pairs:
-        return SearchResponse(query=payload.query, top_k=payload.top_k, embedding_model=DEFAULT_MODEL, hits=[])
+    # With re-ranking, over-fetch candidates from FAISS and let the cross-encoder pick the top_k
+    fetch_k = max(payload.top_k, get_rerank_candidates()) if payload.rerank else payload.top_k
 
-    # Map faiss_id -> chunk_id via ChunkVector
-    fid_list = [fid for fid, _ in pairs]
-    vectors = db.scalars(select(ChunkVector).where(ChunkVector.faiss_id.in_(fid_list))).all()
-    faiss_to_chunk = {v.faiss_id: v.chunk_id for v in vectors}
-
-    chunk_ids = [faiss_to_chunk.get(fid) for fid, _ in pairs]
-    chunk_ids = [cid for cid in chunk_ids if cid is not None]
+    # Search all shards in parallel (dim inferred from vector)
+    with stage("ann_search"):
+        index = get_index(dim=len(qvec), model_name=model_name)
+        chunk_ids, scores = index.search(qvec, top_k=fetch_k)
     if not chunk_ids:
-        return SearchResponse(query=payload.query, top_k=payload.top_k, embedding_model=DEFAULT_MODEL, hits=[])
-
-    # Load chunks + documents
-    chunks = db.scalars(select(Chunk).where(Chunk.id.in_(chunk_ids))).all()
-    chunk_by_id = {c.id: c for c in chunks}
-
-    doc_ids = list({c.document_id for c in chunks})
-    docs = db.scalars(select(Document).where(Document.id.in_(doc_ids))).all()
-    doc_by_id = {d.id: d for d in docs}
-
-    hits: list[SearchHit] = []
-    for fid, sc in pairs:
-        cid = faiss_to_chunk.get(fid)
-        if cid is None:
-            continue
-        ch = chunk_by_id.get(cid)
-        if ch is None:
-            continue
-        doc = doc_by_id.get(ch.document_id)
-        if doc is None:
-            continue
-
-        hits.append(
-            SearchHit(
-                score=float(sc),
-                chunk_id=ch.id,
-                document_id=doc.id,
-                filename=doc.filename,
-                chunk_index=ch.chunk_index,
-                text=ch.text,
-                start_char=ch.start_char,
-                end_char=ch.end_char,
-                created_at=doc.created_at,
+        return SearchResponse(query=payload.query, top_k=payload.top_k, embedding_model=model_name, hits=[])
+
+    with stage("hit_resolution"):
+        # Vector ids are chunk ids: load chunks + documents in one query
+        rows = db.execute(
+            select(Chunk, Document).join(Document, Document.id == Chunk.document_id).where(Chunk.id.in_(chunk_ids))
+        ).all()
+        by_chunk_id = {ch.id: (ch, doc) for ch, doc in rows}
+
+        hits: list[SearchHit] = []
+        for cid, sc in zip(chunk_ids, scores):
+            if cid not in by_chunk_id:
+                continue
+            ch, doc = by_chunk_id[cid]
+
+            hits.append(
+                SearchHit(
+                    score=float(sc),
+                    chunk_id=ch.id,
+                    document_id=doc.id,
+                    filename=doc.filename,
+                    chunk_index=ch.chunk_index,
+                    text=ch.text,
+                    start_char=ch.start_char,
+                    end_char=ch.end_char,
+                    created_at=doc.created_at,
+                )
             )
-        )
 
     # Sort by score desc (FAISS already returns sorted but keep safe)
     hits.sort(key=lambda h: h.score, reverse=True)
 
+    reranked = False
+    rerank_ms: int | None = None
+    if payload.rerank and len(hits) > 1:
+        with stage("rerank"):
+            ce_scores, rerank_ms = rerank_scores(payload.query, [h.text for h in hits])
+        if ce_scores is not None:
+            # None means the latency budget was exceeded: keep the FAISS order
+            for h, ce in zip(hits, ce_scores, strict=True):
+                h.rerank_score = ce
+            hits.sort(key=lambda h: h.rerank_score, reverse=True)
+            reranked = True
+
     return SearchResponse(
         query=payload.query,
         top_k=payload.top_k,
-        embedding_model=DEFAULT_MODEL,
-        hits=hits,
+        embedding_model=model_name,
+        hits=hits[:payload.top_k],
+        reranked=reranked,
+        rerank_ms=rerank_ms,
     )
@@ -3,5 +3,36 @@
 from app.db.database import Base, engine
 from app.db import models  # noqa: F401  (import to register models)
 
+def _upgrade_chunk_vectors() -> None:
+    """
+    Older databases have UNIQUE(chunk_id) on chunk_vectors, which allows a single
+    embedding model per chunk. SQLite can't drop a constraint: rebuild the table.
+    """
+    with engine.begin() as conn:
+        row = conn.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'chunk_vectors'"
+        ).first()
+        if row is None or "uq_chunk_vectors_chunk_id" not in row[0]:
+            return
+
+        # index names survive a rename and would clash with the new table's indexes
+        conn.exec_driver_sql("DROP INDEX IF EXISTS ix_chunk_vectors_chunk_id")
+        conn.exec_driver_sql("DROP INDEX IF EXISTS ix_chunk_vectors_faiss_id")
+        conn.exec_driver_sql("ALTER TABLE chunk_vectors RENAME TO chunk_vectors_old")
+        models.ChunkVector.__table__.create(bind=conn)
+        conn.exec_driver_sql(
+            "INSERT INTO chunk_vectors (id, chunk_id, faiss_id, embedding_model) "
+            "SELECT id, chunk_id, faiss_id, embedding_model FROM chunk_vectors_old"
+        )
+        conn.exec_driver_sql("DROP TABLE chunk_vectors_old")
+
+def _create_missing_indexes() -> None:
+    # create_all skips existing tables, including the indexes added to them later
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
 def init_db() -> None:
+    _upgrade_chunk_vectors()
     Base.metadata.create_all(bind=engine)
+    _create_missing_indexes()
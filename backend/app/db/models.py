@@ -7,7 +7,7 @@ from sqlalchemy import DateTime, String
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy import ForeignKey, Integer, Text
 from sqlalchemy.orm import relationship
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import Index, UniqueConstraint
 
 
 from app.db.database import Base
@@ -19,10 +19,13 @@ class Document(Base):
     filename: Mapped[str] = mapped_column(String, nullable=False)
     content_type: Mapped[str] = mapped_column(String, nullable=False)
     storage_path: Mapped[str] = mapped_column(String, nullable=False)
-    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=dt.datetime.utcnow, nullable=False)
+    # index=True: listing is ordered (and paginated) by created_at
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime, default=dt.datetime.utcnow, nullable=False, index=True)
 
 class Chunk(Base):
     __tablename__ = "chunks"
+    # chunks of a document in order: listing, keyset pagination and export
+    __table_args__ = (Index("ix_chunks_document_id_chunk_index", "document_id", "chunk_index"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     document_id: Mapped[str] = mapped_column(String, ForeignKey("documents.id"), nullable=False, index=True)
@@ -38,7 +41,8 @@ class Chunk(Base):
 
 class ChunkVector(Base):
     __tablename__ = "chunk_vectors"
-    __table_args__ = (UniqueConstraint("chunk_id", name="uq_chunk_vectors_chunk_id"),)
+    # one vector per chunk and per embedding model (several index versions can coexist)
+    __table_args__ = (UniqueConstraint("chunk_id", "embedding_model", name="uq_chunk_vectors_chunk_model"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     chunk_id: Mapped[int] = mapped_column(Integer, ForeignKey("chunks.id"), nullable=False, index=True)
@@ -1,10 +1,18 @@
+import os
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
 
 from app.api.router import api_router
 
+from app.db.database import SessionLocal
 from app.db.init_db import init_db
+from app.services.embeddings import is_warmup_enabled, warm_up
+from app.services.faiss_index import checkpoint_all
+from app.services.indexing import migrate_legacy_indexes, reconcile_indexes
+from app.services.metrics import server_timing, start_profile
+from app.services.reranker import is_rerank_enabled, warm_up as warm_up_reranker
 
 app = FastAPI(title="RAG Knowledge Assistant API")
 
@@ -20,12 +28,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def profile_stages(request: Request, call_next):
+    # X-Profile: 1 returns the per-stage breakdown in a Server-Timing header
+    if request.headers.get("x-profile") not in ("1", "true"):
+        return await call_next(request)
+    profile = start_profile()
+    response = await call_next(request)
+    if profile:
+        response.headers["Server-Timing"] = server_timing(profile)
+    return response
+
 @app.get("/health")
 def health() -> dict[str, str]:
     return {"status": "ok"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # several worker processes: aggregate what each of them wrote to that directory
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 app.include_router(api_router)
 @app.on_event("startup")
 def on_startup() -> None:
     init_db()
+    # convert single-file FAISS indexes from older versions into shards,
+    # then make the indexes and the chunk_vectors rows agree again after a crash
+    db = SessionLocal()
+    try:
+        migrate_legacy_indexes(db)
+        reconcile_indexes(db)
+    finally:
+        db.close()
+    # load the embedding model now rather than on the first search
+    if is_warmup_enabled():
+        warm_up()
+    # same for the cross-encoder, whose load would otherwise eat the first request's budget
+    if is_rerank_enabled():
+        warm_up_reranker()
 
-
+@app.on_event("shutdown")
+def on_shutdown() -> None:
+    # compact the vector logs into snapshots so the next start has nothing to replay
+    checkpoint_all()
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import sys
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+from app.services.metrics import ADMISSION_REJECTED, observe_stage
+
+# lower goes first
+INTERACTIVE = 0  # /v1/chat/stream: someone is watching the tokens arrive
+BATCH = 1        # /v1/chat
+
+PRIORITIES = {"interactive": INTERACTIVE, "batch": BATCH}
+
+# requests allowed at the same time in each stage
+DEFAULT_LIMITS = {"retrieval": 4, "llm": 2}
+
+def is_admission_enabled() -> bool:
+    return os.getenv("ADMISSION_ENABLED", "1").lower() in ("1", "true", "yes")
+
+def get_admission_deadline_s() -> float:
+    # a chat request that can't start generating within this delay gets a 503
+    return float(os.getenv("ADMISSION_DEADLINE_S", "10"))
+
+def get_stage_limit(stage: str) -> int:
+    return int(os.getenv(f"ADMISSION_{stage.upper()}_CONCURRENCY", str(DEFAULT_LIMITS[stage])))
+
+def get_queue_size() -> int:
+    return int(os.getenv("ADMISSION_QUEUE_SIZE", "32"))
+
+def request_priority(header: str | None, default: int) -> int:
+    # X-Priority: interactive | batch overrides the endpoint's default
+    return PRIORITIES.get((header or "").strip().lower(), default)
+
+def request_deadline() -> float:
+    return time.monotonic() + get_admission_deadline_s()
+
+class Overloaded(Exception):
+    def __init__(self, stage: str, reason: str, retry_after: int):
+        super().__init__(f"{stage} overloaded ({reason}), retry in {retry_after}s")
+        self.stage = stage
+        self.reason = reason
+        self.retry_after = retry_after
+
+class Slot:
+    """
+    A place in a stage; release() is idempotent so a streaming body can call it
+    both when it ends and from the response's background task.
+    """
+
+    def __init__(self, gate: Gate):
+        self._gate = gate
+        self._t0 = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._gate._done(time.monotonic() - self._t0)
+
+class Gate:
+    """
+    At most `limit` requests at a time in a stage. The others wait in a bounded
+    queue, by priority then arrival order, until their deadline. Requests that
+    would not get a slot in time are rejected right away instead of piling up.
+    Not thread-safe: used from the event loop only.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+        self._seq = itertools.count()
+        self._service_s: float | None = None  # moving average of the time a slot is held
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def estimated_wait(self, ahead: int) -> float:
+        if self._service_s is None or self.active < self.limit:
+            return 0.0
+        return self._service_s * (ahead + 1) / self.limit
+
+    def _reject(self, reason: str) -> Overloaded:
+        ADMISSION_REJECTED.labels(self.name, reason).inc()
+        retry_after = max(1, math.ceil(self.estimated_wait(len(self._waiters))))
+        return Overloaded(self.name, reason, retry_after)
+
+    def _remove(self, entry: tuple[int, int, asyncio.Future[None]]) -> None:
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+
+    async def acquire(self, priority: int, deadline: float) -> Slot:
+        t0 = time.monotonic()
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return Slot(self)
+
+        ahead = sum(1 for p, _, _ in self._waiters if p <= priority)
+        if self.estimated_wait(ahead) > deadline - t0:
+            raise self._reject("deadline")
+        if len(self._waiters) >= self.max_queue:
+            worst = max(self._waiters)
+            if worst[0] <= priority:
+                raise self._reject("queue_full")
+            # a lower priority request gives its place
+            self._remove(worst)
+            worst[2].set_exception(self._reject("preempted"))
+
+        fut: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._seq), fut)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), deadline - t0)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                self._handoff()  # the slot came too late: pass it on
+            else:
+                fut.cancel()
+                self._remove(entry)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._reject("deadline") from None
+        finally:
+            observe_stage(f"{self.name}_queue", time.monotonic() - t0)
+        return Slot(self)
+
+    def _handoff(self) -> None:
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)  # the slot goes straight to the next waiter
+                return
+        self.active -= 1
+
+    def _done(self, held_s: float) -> None:
+        self._service_s = held_s if self._service_s is None else 0.8 * self._service_s + 0.2 * held_s
+        self._handoff()
+
+    @asynccontextmanager
+    async def slot(self, priority: int, deadline: float) -> AsyncIterator[Slot]:
+        held = await self.acquire(priority, deadline)
+        try:
+            yield held
+        finally:
+            held.release()
+
+@lru_cache(maxsize=None)
+def get_gate(stage: str) -> Gate:
+    if not is_admission_enabled():
+        return Gate(stage, limit=sys.maxsize, max_queue=0)
+    return Gate(stage, limit=get_stage_limit(stage), max_queue=get_queue_size())
@@ -1,19 +1,77 @@
 ﻿from __future__ import annotations
 
+import os
 from functools import lru_cache
-from sentence_transformers import SentenceTransformer
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from app.services.metrics import cache_lookup
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
 DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
-@lru_cache(maxsize=1)
-def get_embedder(model_name: str = DEFAULT_MODEL) -> SentenceTransformer:
-    # cached so we load the model once
+def get_active_model() -> str:
+    # model used for new indexing and for search; switch it once a re-embed has completed
+    return os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL)
+
+def get_allowed_models() -> set[str]:
+    # models /index/reembed may download and load (comma-separated), besides the active one
+    allowed = {m.strip() for m in os.getenv("EMBEDDING_MODELS", "").split(",") if m.strip()}
+    return allowed | {get_active_model()}
+
+def get_embedding_backend() -> str:
+    # "torch" (default), "onnx" (ONNX Runtime) or "int8" (dynamic int8 quantization, CPU)
+    return os.getenv("EMBEDDING_BACKEND", "torch").lower()
+
+def is_warmup_enabled() -> bool:
+    return os.getenv("EMBEDDING_WARMUP", "1").lower() in ("1", "true", "yes")
+
+@lru_cache(maxsize=2)
+def _load_embedder(model_name: str, backend: str) -> SentenceTransformer:
+    # sentence_transformers pulls in torch: import it only when a model is actually needed
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        # e.g. EMBEDDING_ONNX_FILE=onnx/model_qint8_avx512_vnni.onnx for a quantized export
+        onnx_file = os.getenv("EMBEDDING_ONNX_FILE")
+        model_kwargs = {"file_name": onnx_file} if onnx_file else None
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
+
+    if backend == "int8":
+        import torch
+
+        model = SentenceTransformer(model_name, device="cpu")
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return model
+
+    if backend != "torch":
+        raise RuntimeError(f"Unknown embedding backend: {backend}")
     return SentenceTransformer(model_name)
 
-def embed_texts(texts: list[str], model_name: str = DEFAULT_MODEL) -> list[list[float]]:
+def get_embedder(model_name: str = DEFAULT_MODEL) -> SentenceTransformer:
+    # cached so we load each model once (two can coexist during a re-embed)
+    misses = _load_embedder.cache_info().misses
+    model = _load_embedder(model_name, get_embedding_backend())
+    cache_lookup("embedder", _load_embedder.cache_info().misses == misses)
+    return model
+
+def warm_up(model_name: str | None = None) -> None:
+    """
+    Load the model and run one encode so the first request doesn't pay for it.
+    """
+    model = get_embedder(model_name or get_active_model())
+    model.encode(["warm-up"], normalize_embeddings=True)
+
+def embed_texts(texts: list[str], model_name: str = DEFAULT_MODEL) -> np.ndarray:
+    """
+    Returns a (n, dim) float32 C-contiguous array, handed to FAISS without any copy.
+    """
     model = get_embedder(model_name)
-    vectors = model.encode(texts, normalize_embeddings=True)
-    return vectors.tolist()
+    vectors = model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+    return np.ascontiguousarray(vectors, dtype=np.float32)
 
-def embed_query(query: str, model_name: str = DEFAULT_MODEL) -> list[float]:
+def embed_query(query: str, model_name: str = DEFAULT_MODEL) -> np.ndarray:
     return embed_texts([query], model_name=model_name)[0]
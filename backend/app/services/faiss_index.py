@@ -1,29 +1,508 @@
 ﻿from __future__ import annotations
 
+import heapq
+import json
+import os
+import re
+import threading
+import zlib
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
 import faiss
 import numpy as np
 
+from app.services.embeddings import DEFAULT_MODEL
+from app.services.metrics import INDEX_VECTORS, cache_lookup
+
+# pre-sharding single-file indexes, only read by the startup migration
 INDEX_PATH = Path("data") / "faiss.index"
+INDEX_ROOT = Path("data") / "index"
+
+def legacy_index_path(model_name: str = DEFAULT_MODEL) -> Path:
+    if model_name == DEFAULT_MODEL:
+        return INDEX_PATH
+    return INDEX_PATH.parent / f"faiss-{model_slug(model_name)}.index"
+
+def model_slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model_name).strip("._")
+
+def index_dir_for(model_name: str = DEFAULT_MODEL) -> Path:
+    # one directory of shards per embedding model, so several versions can coexist
+    return INDEX_ROOT / model_slug(model_name)
+
+# fraction of the trained sq8 range added on each side
+SQ8_RANGE_MARGIN = 0.1
+
+def get_index_storage() -> str:
+    # "flat" (float32, exact), "fp16" (half the memory) or "sq8" (int8 scalar quantization, 1/4)
+    return os.getenv("FAISS_STORAGE", "flat").lower()
+
+def get_shard_count() -> int:
+    # only used when an index is created; existing indexes keep their shard count
+    return int(os.getenv("FAISS_SHARDS", "4"))
+
+def get_snapshot_every() -> int:
+    # log records after which a shard is compacted into a new snapshot
+    return int(os.getenv("FAISS_SNAPSHOT_EVERY", "10000"))
 
-def load_or_create_index(dim: int) -> faiss.Index:
-    if INDEX_PATH.exists():
-        return faiss.read_index(str(INDEX_PATH))
+def get_search_threads() -> int:
+    return int(os.getenv("FAISS_SEARCH_THREADS", str(min(get_shard_count(), os.cpu_count() or 1))))
+
+def create_index(dim: int, storage: str | None = None) -> faiss.Index:
+    storage = storage or get_index_storage()
     # Inner Product index (works with normalized vectors == cosine)
-    return faiss.IndexFlatIP(dim)
-
-def save_index(index: faiss.Index) -> None:
-    INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
-    faiss.write_index(index, str(INDEX_PATH))
-
-def add_vectors(index: faiss.Index, vectors: list[list[float]]) -> list[int]:
-    arr = np.array(vectors, dtype="float32")
-    start_id = index.ntotal
-    index.add(arr)
-    # faiss ids are implicit for IndexFlat: 0..ntotal-1
-    return list(range(start_id, start_id + arr.shape[0]))
-
-def search(index: faiss.Index, query_vec: list[float], top_k: int = 5) -> tuple[list[int], list[float]]:
-    q = np.array([query_vec], dtype="float32")
-    scores, ids = index.search(q, top_k)
-    return ids[0].tolist(), scores[0].tolist()
+    if storage == "flat":
+        return faiss.IndexFlatIP(dim)
+    if storage == "fp16":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    if storage == "sq8":
+        # untrained: see train_index()
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit_uniform, faiss.METRIC_INNER_PRODUCT)
+    raise RuntimeError(f"Unknown FAISS storage: {storage}")
+
+def train_index(index: faiss.Index, vectors: np.ndarray) -> None:
+    """
+    sq8 learns its int8 range from real vectors: embedding components use a small
+    part of [-1, 1], and quantizing that whole range costs ~10 points of recall@10.
+    One range for all dimensions (QT_8bit_uniform) is as accurate as one per
+    dimension on large samples, and still is on the few vectors of a first document.
+    """
+    if index.is_trained:
+        return
+    # room for later vectors slightly outside the range of the sample
+    index.sq.rangestat_arg = SQ8_RANGE_MARGIN
+    index.train(np.ascontiguousarray(vectors, dtype="float32"))
+
+def shard_for(document_id: str, n_shards: int) -> int:
+    # stable across processes (unlike hash()): all chunks of a document land in the same shard
+    return zlib.crc32(document_id.encode("utf-8")) % n_shards
+
+@lru_cache(maxsize=1)
+def _get_executor() -> ThreadPoolExecutor:
+    # FAISS releases the GIL while searching, so threads do run shards in parallel
+    return ThreadPoolExecutor(max_workers=get_search_threads(), thread_name_prefix="faiss")
+
+class _RWLock:
+    """
+    Many concurrent searches, or one writer. FAISS indexes aren't safe to search during an add.
+    A waiting writer goes first: new searches wait for it, else a steady stream of them
+    would keep it (and the cross-process index lock it holds) waiting forever.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_read(self) -> None:
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self) -> None:
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self) -> None:
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+
+    def release_write(self) -> None:
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+def _fsync_dir(path: Path) -> None:
+    # make a rename durable (not possible, nor needed, on Windows)
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _atomic_write_bytes(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path.parent)
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """
+    Exclusive lock shared by every worker process (advisory, not reentrant:
+    don't take the same lock twice in one process).
+    """
+    with path.open("a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def writer_lock(root: Path) -> Iterator[None]:
+    """
+    Lock of the writers of the index in `root`. The lock file sits next to the
+    directory, so it can be taken before the index exists.
+    """
+    root.parent.mkdir(parents=True, exist_ok=True)
+    with file_lock(root.with_name(root.name + ".lock")):
+        yield
+
+OP_ADD = b"A"
+OP_DELETE = b"D"
+
+class ShardedIndex:
+    """
+    Vectors of one embedding model split into N shards by document, ids = chunk ids.
+
+    Each shard is persisted as a snapshot (`shard-NN.<seq>.index`) plus an append-only
+    log (`shard-NN.log`) of the operations since that snapshot. A write appends its
+    records and fsyncs the log, so its cost is proportional to the new vectors; the
+    shard is only rewritten (to a temp file, then renamed) every FAISS_SNAPSHOT_EVERY
+    records. Log records carry a sequence number: on load, the newest snapshot is
+    read and only the records after its seq are replayed, so a crash at any point
+    leaves a consistent shard. Writers must hold `writer()`.
+
+    Storages that need training (sq8) are trained on the first vectors added. The
+    trained empty index (`trained.index`) is saved before they are logged, and every
+    shard is a copy of it, so all shards and processes quantize the same way.
+    """
+
+    def __init__(self, root: Path, dim: int, storage: str, n_shards: int) -> None:
+        self.root = root
+        self.dim = dim
+        self.storage = storage
+        self.n_shards = n_shards
+        # fixed-size records: deletes carry an unused vector, they are rare
+        self.record = np.dtype([("op", "S1"), ("seq", "<u8"), ("id", "<i8"), ("vec", "<f4", (dim,))])
+        template = create_index(dim, storage)
+        self._trained: faiss.Index | None = template if template.is_trained else None
+        self.shards: list[faiss.Index] = [self._empty() for _ in range(n_shards)]
+        self._locks = [_RWLock() for _ in range(n_shards)]
+        self._snap_seq = [0] * n_shards    # seq of the loaded snapshot
+        self._seq = [0] * n_shards         # last seq applied in memory
+        self._log_offset = [0] * n_shards  # bytes of the log already applied
+        self._log_records = [0] * n_shards
+        # held by refreshes and, for their whole duration, by writers of this process
+        self._refresh_lock = threading.RLock()
+
+    @property
+    def trained_path(self) -> Path:
+        return self.root / "trained.index"
+
+    def _trained_template(self) -> faiss.Index | None:
+        if self._trained is None and self.trained_path.exists():
+            self._trained = faiss.read_index(str(self.trained_path))
+        return self._trained
+
+    def _fixed_range(self) -> faiss.Index:
+        # sq8 indexes of older versions were trained on [-1, 1] and saved no parameters
+        index = create_index(self.dim, self.storage)
+        index.train(np.array([[-1.0] * self.dim, [1.0] * self.dim], dtype="float32"))
+        return index
+
+    def _train(self, vectors: np.ndarray) -> None:
+        if any(s.is_trained for s in self.shards):
+            # shards loaded from snapshots of an older version: keep their range
+            index = self._fixed_range()
+        else:
+            index = create_index(self.dim, self.storage)
+            train_index(index, vectors)
+        _atomic_write_bytes(self.trained_path, faiss.serialize_index(index).tobytes())
+        self._trained = index
+
+    def _empty(self) -> faiss.Index:
+        # untrained (and empty) until the first vectors are added
+        trained = self._trained_template()
+        return faiss.IndexIDMap2(faiss.clone_index(trained) if trained is not None else create_index(self.dim, self.storage))
+
+    @property
+    def ntotal(self) -> int:
+        return sum(s.ntotal for s in self.shards)
+
+    def log_path(self, shard: int) -> Path:
+        return self.root / f"shard-{shard:02d}.log"
+
+    def snapshot_path(self, shard: int, seq: int) -> Path:
+        return self.root / f"shard-{shard:02d}.{seq:012d}.index"
+
+    def _snapshots(self, shard: int) -> list[tuple[int, Path]]:
+        found = []
+        for p in self.root.glob(f"shard-{shard:02d}.*.index"):
+            try:
+                found.append((int(p.name.split(".")[1]), p))
+            except ValueError:
+                continue
+        return sorted(found)
+
+    @classmethod
+    def create(cls, root: Path, dim: int, n_shards: int | None = None, storage: str | None = None) -> ShardedIndex:
+        return cls(root, dim, storage or get_index_storage(), n_shards or get_shard_count())
+
+    @classmethod
+    def load(cls, root: Path) -> ShardedIndex:
+        meta = json.loads((root / "meta.json").read_text(encoding="utf-8"))
+        index = cls(root, meta["dim"], meta["storage"], meta["shards"])
+        for i in range(index.n_shards):
+            index._load_shard(i)
+        return index
+
+    def _write_meta(self) -> None:
+        meta = self.root / "meta.json"
+        if not meta.exists():
+            data = json.dumps({"dim": self.dim, "shards": self.n_shards, "storage": self.storage})
+            _atomic_write_bytes(meta, data.encode("utf-8"))
+
+    def _load_shard(self, shard: int) -> None:
+        seq, index = 0, self._empty()
+        for _ in range(3):
+            snapshots = self._snapshots(shard)
+            if not snapshots:
+                break
+            seq, path = snapshots[-1]
+            try:
+                index = faiss.read_index(str(path))
+                break
+            except RuntimeError:
+                # replaced by a newer snapshot from another process while listing: retry
+                seq, index = 0, self._empty()
+        self._locks[shard].acquire_write()
+        try:
+            self.shards[shard] = index
+        finally:
+            self._locks[shard].release_write()
+        self._snap_seq[shard] = self._seq[shard] = seq
+        self._log_offset[shard] = self._log_records[shard] = 0
+        self._replay(shard)
+
+    def _replay(self, shard: int) -> None:
+        path = self.log_path(shard)
+        if not path.exists():
+            return
+        with path.open("rb") as f:
+            f.seek(self._log_offset[shard])
+            data = f.read()
+        # a torn last record (crash, or another process mid-append) is left for later
+        n = len(data) // self.record.itemsize
+        if not n:
+            return
+        records = np.frombuffer(data, dtype=self.record, count=n)
+        self._apply(shard, records[records["seq"] > self._seq[shard]])
+        self._log_offset[shard] += n * self.record.itemsize
+        self._log_records[shard] += n
+
+    def _apply(self, shard: int, records: np.ndarray) -> None:
+        if not len(records):
+            return
+        self._locks[shard].acquire_write()
+        try:
+            index = self.shards[shard]
+            # apply runs of adds in one call, deletes as they come (order matters)
+            start = 0
+            ops = records["op"]
+            for end in range(1, len(records) + 1):
+                if end < len(records) and ops[end] == ops[start]:
+                    continue
+                run = records[start:end]
+                if ops[start] == OP_ADD:
+                    if not index.is_trained:
+                        # still empty: the parameters were saved since, by this process or another
+                        # (none at all: records of an older version)
+                        if self._trained_template() is None:
+                            self._trained = self._fixed_range()
+                        index = self.shards[shard] = self._empty()
+                    index.add_with_ids(np.ascontiguousarray(run["vec"]), np.ascontiguousarray(run["id"]))
+                else:
+                    index.remove_ids(np.ascontiguousarray(run["id"]))
+                start = end
+        finally:
+            self._locks[shard].release_write()
+        self._seq[shard] = int(records["seq"][-1])
+
+    def refresh(self) -> None:
+        """
+        Pick up what other worker processes wrote: a new snapshot reloads the shard,
+        new log records are replayed incrementally.
+        """
+        # busy means a writer of this process holds it, and is applying the changes itself
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            for i in range(self.n_shards):
+                snapshots = self._snapshots(i)
+                snap_seq = snapshots[-1][0] if snapshots else 0
+                log = self.log_path(i)
+                size = log.stat().st_size if log.exists() else 0
+                if snap_seq != self._snap_seq[i] or size < self._log_offset[i]:
+                    self._load_shard(i)
+                elif size >= self._log_offset[i] + self.record.itemsize:
+                    self._replay(i)
+        finally:
+            self._refresh_lock.release()
+
+    @contextmanager
+    def writer(self) -> Iterator[ShardedIndex]:
+        """
+        Exclusive write access across threads and processes, with an up-to-date index.
+        """
+        with self._refresh_lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with writer_lock(self.root):
+                self.refresh()
+                yield self
+
+    def _append(self, shard: int, op: bytes, vectors: np.ndarray | None, ids: list[int]) -> None:
+        records = np.zeros(len(ids), dtype=self.record)
+        records["op"] = op
+        records["seq"] = np.arange(self._seq[shard] + 1, self._seq[shard] + 1 + len(ids), dtype="uint64")
+        records["id"] = ids
+        if vectors is not None:
+            records["vec"] = vectors
+
+        self._write_meta()
+        if vectors is not None and self._trained_template() is None:
+            self._train(vectors)
+        with self.log_path(shard).open("ab") as f:
+            if f.tell() > self._log_offset[shard]:
+                # torn record left by a writer that crashed mid-append
+                f.truncate(self._log_offset[shard])
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        self._log_offset[shard] += records.nbytes
+        self._log_records[shard] += len(records)
+        self._apply(shard, records)
+
+        if self._log_records[shard] >= get_snapshot_every():
+            self.checkpoint([shard])
+
+    def add(self, shard: int, vectors: np.ndarray, ids: list[int]) -> None:
+        self._append(shard, OP_ADD, vectors, ids)
+
+    def remove(self, shard: int, ids: list[int]) -> None:
+        self._append(shard, OP_DELETE, None, ids)
+
+    def ids(self, shard: int) -> np.ndarray:
+        self._locks[shard].acquire_read()
+        try:
+            return faiss.vector_to_array(self.shards[shard].id_map).copy()
+        finally:
+            self._locks[shard].release_read()
+
+    def checkpoint(self, shards: Iterable[int] | None = None) -> None:
+        """
+        Write a snapshot of each shard (temp file + atomic rename), then drop its log.
+        """
+        for i in range(self.n_shards) if shards is None else shards:
+            seq = self._seq[i]
+            if seq == self._snap_seq[i] and not self._log_records[i]:
+                continue
+            path = self.snapshot_path(i, seq)
+            tmp = path.with_name(path.name + ".tmp")
+            self._locks[i].acquire_read()
+            try:
+                faiss.write_index(self.shards[i], str(tmp))
+            finally:
+                self._locks[i].release_read()
+            with tmp.open("rb+") as f:
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            _fsync_dir(self.root)
+
+            # the snapshot now covers every record: older files can go
+            for old_seq, old in self._snapshots(i):
+                if old_seq < seq:
+                    old.unlink(missing_ok=True)
+            with self.log_path(i).open("wb"):
+                pass
+            self._snap_seq[i] = seq
+            self._log_offset[i] = self._log_records[i] = 0
+
+    def _search_shard(self, shard: int, q: np.ndarray, top_k: int) -> list[tuple[float, int]]:
+        self._locks[shard].acquire_read()
+        try:
+            if not self.shards[shard].ntotal:
+                return []  # possibly not trained yet
+            scores, ids = self.shards[shard].search(q, top_k)
+        finally:
+            self._locks[shard].release_read()
+        return [(float(s), int(i)) for s, i in zip(scores[0], ids[0]) if i >= 0]
+
+    def search(self, query_vec: np.ndarray, top_k: int = 5) -> tuple[list[int], list[float]]:
+        q = np.ascontiguousarray(query_vec, dtype="float32").reshape(1, -1)
+        if self.n_shards == 1:
+            results = [self._search_shard(0, q, top_k)]
+        else:
+            executor = _get_executor()
+            futures = [executor.submit(self._search_shard, i, q, top_k) for i in range(self.n_shards)]
+            results = [f.result() for f in futures]
+        # each shard returns its own top_k: merge into the global top_k
+        best = heapq.nlargest(top_k, (hit for r in results for hit in r))
+        return [i for _, i in best], [s for s, _ in best]
+
+_indexes: dict[str, ShardedIndex] = {}
+_indexes_lock = threading.Lock()
+
+def index_exists(model_name: str = DEFAULT_MODEL) -> bool:
+    return (index_dir_for(model_name) / "meta.json").exists()
+
+def get_index(dim: int | None, model_name: str = DEFAULT_MODEL) -> ShardedIndex:
+    """
+    Process-wide index of a model: loaded once, then kept up to date from the log.
+    `dim` is only needed to create an index that doesn't exist yet.
+    """
+    with _indexes_lock:
+        index = _indexes.get(model_name)
+        cache_lookup("index", index is not None)
+        if index is None:
+            root = index_dir_for(model_name)
+            if (root / "meta.json").exists():
+                index = ShardedIndex.load(root)
+            elif dim is None:
+                raise RuntimeError(f"No FAISS index for model {model_name}")
+            else:
+                index = ShardedIndex.create(root, dim)
+            _indexes[model_name] = index
+            INDEX_VECTORS.labels(model_name).set(index.ntotal)
+            return index
+    index.refresh()
+    return index
+
+def checkpoint_all() -> None:
+    # compact every loaded index, e.g. on shutdown, so the next start has no log to replay
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        with index.writer():
+            index.checkpoint()
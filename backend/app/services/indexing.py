@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import os
+import shutil
+import time
+from collections import defaultdict
+from collections.abc import Sequence
+from pathlib import Path
+
+import faiss
+import numpy as np
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+
+from app.db.models import Chunk, ChunkVector
+from app.services.embeddings import embed_texts, get_active_model
+from app.services.faiss_index import (
+    ShardedIndex,
+    file_lock,
+    get_index,
+    index_dir_for,
+    index_exists,
+    legacy_index_path,
+    shard_for,
+    writer_lock,
+)
+from app.services.metrics import CHUNKS_INDEXED, EMBED_BATCH_SIZE, INDEX_VECTORS, INDEXING_SECONDS
+
+def _model_chunk_ids(db: Session, model_name: str) -> set[int]:
+    return set(db.scalars(select(ChunkVector.chunk_id).where(ChunkVector.embedding_model == model_name)).all())
+
+def _indexed_chunk_ids(db: Session, chunk_ids: list[int], model_name: str) -> set[int]:
+    return set(
+        db.scalars(
+            select(ChunkVector.chunk_id).where(
+                ChunkVector.embedding_model == model_name,
+                ChunkVector.chunk_id.in_(chunk_ids),
+            )
+        ).all()
+    )
+
+def index_chunks(db: Session, chunks: Sequence[Chunk], model_name: str) -> int:
+    """
+    Embed the chunks not yet indexed for `model_name` and add them to that model's index.
+    Returns the number of newly indexed chunks.
+    """
+    if not chunks:
+        return 0
+
+    # Filter chunks already indexed with this model
+    existing = _indexed_chunk_ids(db, [c.id for c in chunks], model_name)
+    to_index = [c for c in chunks if c.id not in existing]
+
+    if not to_index:
+        return 0
+
+    # embedding is the slow part: done before taking the writer lock
+    t0 = time.perf_counter()
+    texts = [c.text for c in to_index]
+    EMBED_BATCH_SIZE.observe(len(texts))
+    vectors = embed_texts(texts, model_name=model_name)
+
+    index = get_index(vectors.shape[1], model_name=model_name)
+    with index.writer():
+        # another request may have indexed some of them while we were embedding
+        existing = _indexed_chunk_ids(db, [c.id for c in to_index], model_name)
+        rows = [r for r, c in enumerate(to_index) if c.id not in existing]
+        if not rows:
+            return 0
+
+        # vectors go to the log first: a crash before the DB commit leaves orphan
+        # vectors, which reconcile_index removes at startup
+        rows_by_shard: dict[int, list[int]] = defaultdict(list)
+        for r in rows:
+            rows_by_shard[shard_for(to_index[r].document_id, index.n_shards)].append(r)
+        for shard, shard_rows in rows_by_shard.items():
+            index.add(shard, vectors[shard_rows], [to_index[r].id for r in shard_rows])
+
+        try:
+            # the vector id in the index is the chunk id
+            for r in rows:
+                c = to_index[r]
+                db.add(ChunkVector(chunk_id=c.id, faiss_id=c.id, embedding_model=model_name))
+            db.commit()
+        except Exception:
+            db.rollback()
+            for shard, shard_rows in rows_by_shard.items():
+                index.remove(shard, [to_index[r].id for r in shard_rows])
+            raise
+
+    # chunks/s = rate(rag_chunks_indexed_total) / rate(rag_indexing_seconds_total)
+    CHUNKS_INDEXED.labels(model_name).inc(len(rows))
+    INDEXING_SECONDS.labels(model_name).inc(time.perf_counter() - t0)
+    INDEX_VECTORS.labels(model_name).set(index.ntotal)
+    return len(rows)
+
+def reembed_all(db: Session, model_name: str, batch_size: int = 256) -> int:
+    """
+    Build (or complete) the index of `model_name` from every chunk in the DB.
+    Runs alongside the live index: search keeps using the active model until it is switched.
+    """
+    total = 0
+    last_id = 0
+    while True:
+        batch = db.scalars(
+            select(Chunk).where(Chunk.id > last_id).order_by(Chunk.id.asc()).limit(batch_size)
+        ).all()
+        if not batch:
+            return total
+        total += index_chunks(db, batch, model_name)
+        last_id = batch[-1].id
+
+def index_status(db: Session) -> tuple[int, dict[str, int]]:
+    """
+    Returns: (total number of chunks, number of indexed chunks per embedding model)
+    """
+    total = db.scalar(select(func.count()).select_from(Chunk)) or 0
+    rows = db.execute(
+        select(ChunkVector.embedding_model, func.count()).group_by(ChunkVector.embedding_model)
+    ).all()
+    return total, {model: count for model, count in rows}
+
+def migrate_legacy_index(db: Session, model_name: str) -> None:
+    """
+    Convert a pre-sharding single-file index (implicit ids 0..n-1) into shards keyed by chunk id.
+    Safe to re-run after a crash: the shard directory only appears once everything is done.
+    """
+    legacy = legacy_index_path(model_name)
+    root = index_dir_for(model_name)
+    if not legacy.exists():
+        return
+    # every worker runs the startup hook: one migrates, the others wait and find it done
+    root.parent.mkdir(parents=True, exist_ok=True)
+    with file_lock(root.parent / ".migrate.lock"):
+        if not legacy.exists():
+            return
+        if root.exists():
+            legacy.replace(legacy.with_name(legacy.name + ".legacy"))
+            return
+        _migrate(db, model_name, legacy, root)
+
+def _migrate(db: Session, model_name: str, legacy: Path, root: Path) -> None:
+    tmp = root.with_name(root.name + ".tmp")
+    done = tmp / ".migrated"
+    if not done.exists():
+        # ChunkVector.faiss_id still holds legacy ids until the shards are fully written
+        shutil.rmtree(tmp, ignore_errors=True)
+        old = faiss.read_index(str(legacy))
+        rows = db.execute(
+            select(ChunkVector.chunk_id, ChunkVector.faiss_id, Chunk.document_id)
+            .join(Chunk, Chunk.id == ChunkVector.chunk_id)
+            .where(ChunkVector.embedding_model == model_name)
+        ).all()
+        index = ShardedIndex.create(tmp, old.d)
+        by_shard: dict[int, list[tuple[int, int]]] = defaultdict(list)
+        for chunk_id, faiss_id, document_id in rows:
+            if 0 <= faiss_id < old.ntotal:
+                by_shard[shard_for(document_id, index.n_shards)].append((chunk_id, faiss_id))
+        with index.writer():
+            for shard, pairs in by_shard.items():
+                vectors = np.vstack([old.reconstruct(fid) for _, fid in pairs])
+                index.add(shard, vectors, [cid for cid, _ in pairs])
+            index.checkpoint()
+        done.touch()
+
+    # idempotent: fine to apply again if we crashed after the commit
+    db.execute(
+        update(ChunkVector).where(ChunkVector.embedding_model == model_name).values(faiss_id=ChunkVector.chunk_id)
+    )
+    db.commit()
+    os.replace(tmp, root)
+    legacy.replace(legacy.with_name(legacy.name + ".legacy"))
+
+def migrate_legacy_indexes(db: Session) -> None:
+    for model_name in db.scalars(select(ChunkVector.embedding_model).distinct()).all():
+        migrate_legacy_index(db, model_name)
+
+def reconcile_index(db: Session, model_name: str) -> tuple[int, int]:
+    """
+    Startup consistency check between the index and the ChunkVector rows of a model:
+    vectors without a row (crash before the DB commit) are removed from the index,
+    rows without a vector (lost index files) are deleted so the chunks get re-indexed.
+    Returns: (removed vectors, deleted rows)
+    """
+    # the rows are read under the writers' lock: a row committed by another worker
+    # before it is taken must be compared with an index that has its vector
+    if not index_exists(model_name):
+        with writer_lock(index_dir_for(model_name)):
+            if not index_exists(model_name):
+                indexed = _model_chunk_ids(db, model_name)
+                if indexed:
+                    db.execute(delete(ChunkVector).where(ChunkVector.embedding_model == model_name))
+                    db.commit()
+                return 0, len(indexed)
+
+    if model_name == get_active_model():
+        index = get_index(None, model_name=model_name)
+    else:
+        # not served (a model retired by a re-embed): don't keep its index in memory afterwards
+        index = ShardedIndex.load(index_dir_for(model_name))
+    with index.writer():
+        indexed = _model_chunk_ids(db, model_name)
+        in_index: set[int] = set()
+        removed = 0
+        for shard in range(index.n_shards):
+            ids = index.ids(shard).tolist()
+            in_index.update(ids)
+            orphans = [i for i in ids if i not in indexed]
+            if orphans:
+                index.remove(shard, orphans)
+                removed += len(orphans)
+
+        missing = list(indexed - in_index)
+        if missing:
+            db.execute(
+                delete(ChunkVector).where(
+                    ChunkVector.embedding_model == model_name, ChunkVector.chunk_id.in_(missing)
+                )
+            )
+            db.commit()
+        if removed:
+            index.checkpoint()
+    return removed, len(missing)
+
+def reconcile_indexes(db: Session) -> None:
+    models = set(db.scalars(select(ChunkVector.embedding_model).distinct()).all())
+    for model_name in models:
+        reconcile_index(db, model_name)
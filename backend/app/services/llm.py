@@ -12,9 +12,15 @@ def get_provider() -> Provider:
     # default local
     return os.getenv("LLM_PROVIDER", "ollama").lower()  # type: ignore[return-value]
 
+def get_ollama_url() -> str:
+    return os.getenv("OLLAMA_URL", "http://127.0.0.1:11434").rstrip("/")
+
 def get_ollama_model() -> str:
     return os.getenv("OLLAMA_MODEL", "llama3.2:3b")
 
+def get_llm_timeout_s() -> float:
+    return float(os.getenv("LLM_TIMEOUT_S", "120"))
+
 def get_openai_model() -> str:
     return os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
@@ -25,12 +31,13 @@ async def generate(provider: Provider, prompt: str) -> tuple[str, str]:
     """
     Returns: (answer, used_model)
     """
+    timeout = get_llm_timeout_s()
     if provider == "ollama":
         model = get_ollama_model()
         # Ollama API: POST http://localhost:11434/api/generate
-        async with httpx.AsyncClient(timeout=120) as client:
+        async with httpx.AsyncClient(timeout=timeout) as client:
             r = await client.post(
-                "http://127.0.0.1:11434/api/generate",
+                f"{get_ollama_url()}/api/generate",
                 json={
                     "model": model,
                     "prompt": prompt,
@@ -51,7 +58,7 @@ async def generate(provider: Provider, prompt: str) -> tuple[str, str]:
             raise RuntimeError("OPENAI_API_KEY is missing")
         model = get_openai_model()
         # OpenAI Chat Completions compatible endpoint style
-        async with httpx.AsyncClient(timeout=120) as client:
+        async with httpx.AsyncClient(timeout=timeout) as client:
             r = await client.post(
                 "https://api.openai.com/v1/chat/completions",
                 headers={"Authorization": f"Bearer {key}"},
@@ -73,10 +80,11 @@ async def generate(provider: Provider, prompt: str) -> tuple[str, str]:
 
 async def generate_stream_ollama(prompt: str) -> AsyncIterator[str]:
     model = get_ollama_model()
-    async with httpx.AsyncClient(timeout=None) as client:
+    # per read: a long answer is fine as long as tokens keep coming
+    async with httpx.AsyncClient(timeout=get_llm_timeout_s()) as client:
         async with client.stream(
             "POST",
-            "http://127.0.0.1:11434/api/generate",
+            f"{get_ollama_url()}/api/generate",
             json={
                 "model": model,
                 "prompt": prompt,
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# embed, ann_search, hit_resolution, rerank, prompt_build, llm_ttft, llm_generation,
+# and the time spent waiting for admission: retrieval_queue, llm_queue
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Latency of each request stage",
+    ["stage"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+CHUNKS_INDEXED = Counter("rag_chunks_indexed_total", "Chunks embedded and added to the index", ["model"])
+INDEXING_SECONDS = Counter("rag_indexing_seconds_total", "Time spent embedding and indexing chunks", ["model"])
+EMBED_BATCH_SIZE = Histogram(
+    "rag_embed_batch_size",
+    "Number of texts per embedding call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024),
+)
+INDEX_VECTORS = Gauge("rag_index_vectors", "Vectors in the index", ["model"])
+CACHE_REQUESTS = Counter("rag_cache_requests_total", "Cache lookups", ["cache", "result"])
+ADMISSION_REJECTED = Counter(
+    "rag_admission_rejected_total", "Requests turned away by admission control", ["stage", "reason"]
+)
+
+# per-request stage breakdown, only set when the caller asked for it (X-Profile header)
+_profile: ContextVar[dict[str, float] | None] = ContextVar("rag_profile", default=None)
+
+def start_profile() -> dict[str, float]:
+    profile: dict[str, float] = {}
+    _profile.set(profile)
+    return profile
+
+def get_profile() -> dict[str, float] | None:
+    return _profile.get()
+
+def observe_stage(name: str, seconds: float, profile: dict[str, float] | None = None) -> None:
+    """
+    `profile` is for code running outside the request context (e.g. a streaming body).
+    """
+    STAGE_SECONDS.labels(name).observe(seconds)
+    profile = profile if profile is not None else _profile.get()
+    if profile is not None:
+        profile[name] = profile.get(name, 0.0) + seconds * 1000
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - t0)
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+def server_timing(profile: dict[str, float]) -> str:
+    # standard Server-Timing header, shown by browser dev tools
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in profile.items())
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Any
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+def is_rerank_enabled() -> bool:
+    return os.getenv("RERANK_ENABLED", "0").lower() in ("1", "true", "yes")
+
+def get_rerank_model() -> str:
+    return os.getenv("RERANK_MODEL", DEFAULT_RERANK_MODEL)
+
+def get_rerank_budget_ms() -> int:
+    # au-delà de ce budget on garde l'ordre FAISS
+    return int(os.getenv("RERANK_BUDGET_MS", "300"))
+
+def get_rerank_candidates() -> int:
+    # nombre de candidats FAISS envoyés au cross-encoder
+    return int(os.getenv("RERANK_CANDIDATES", "20"))
+
+def get_rerank_keep() -> int:
+    # re-ranked hits are more precise: fewer context blocks are needed in the prompt
+    return int(os.getenv("RERANK_KEEP", "3"))
+
+def get_rerank_batch_size() -> int:
+    return int(os.getenv("RERANK_BATCH_SIZE", "8"))
+
+@lru_cache(maxsize=1)
+def get_cross_encoder(model_name: str) -> Any:
+    # imported lazily: only paid for when re-ranking is actually used
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(model_name, max_length=512)
+
+def warm_up() -> None:
+    """
+    Load the cross-encoder and score one pair so the first request doesn't pay for it.
+    """
+    get_cross_encoder(get_rerank_model()).predict([("warm-up", "warm-up")])
+
+@lru_cache(maxsize=1)
+def _get_executor() -> ThreadPoolExecutor:
+    workers = int(os.getenv("RERANK_WORKERS", "2"))
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rerank")
+
+# batches of requests that ran out of budget and are still being scored
+_stragglers: list[Future] = []
+_stragglers_lock = threading.Lock()
+
+def _pool_busy() -> bool:
+    with _stragglers_lock:
+        _stragglers[:] = [f for f in _stragglers if not f.done()]
+        return bool(_stragglers)
+
+def rerank_scores(
+    query: str,
+    texts: list[str],
+    budget_ms: int | None = None,
+    batch_size: int | None = None,
+) -> tuple[list[float] | None, int]:
+    """
+    Score (query, text) pairs with the cross-encoder, batched across the worker pool.
+    Returns: (scores or None if the budget was exceeded, elapsed_ms)
+    While batches of an earlier request are still running past their budget, the
+    pool has no room for this one: it is skipped rather than queued behind them.
+    """
+    if not texts:
+        return [], 0
+
+    budget_ms = get_rerank_budget_ms() if budget_ms is None else budget_ms
+    batch_size = get_rerank_batch_size() if batch_size is None else batch_size
+
+    # loaded before the clock starts: a cold start is not a reason to drop re-ranking
+    # (and is normally paid by warm_up() at startup)
+    model = get_cross_encoder(get_rerank_model())
+    t0 = time.perf_counter()
+    if _pool_busy():
+        return None, 0
+
+    pairs = [(query, t) for t in texts]
+    batches = [pairs[i:i + batch_size] for i in range(0, len(pairs), batch_size)]
+
+    executor = _get_executor()
+    futures = [executor.submit(model.predict, b, batch_size=batch_size) for b in batches]
+
+    remaining = max(0.0, budget_ms / 1000 - (time.perf_counter() - t0))
+    done, not_done = wait(futures, timeout=remaining)
+    elapsed_ms = int((time.perf_counter() - t0) * 1000)
+
+    if not_done:
+        # budget exceeded: don't wait; batches not started yet are dropped, the
+        # running ones finish in the background and hold off the next requests
+        with _stragglers_lock:
+            _stragglers.extend(f for f in not_done if not f.cancel())
+        return None, elapsed_ms
+
+    scores: list[float] = []
+    try:
+        for f in futures:
+            scores.extend(float(s) for s in f.result())
+    except Exception:
+        # a failing cross-encoder must not break search: fall back to FAISS order
+        return None, elapsed_ms
+    return scores, elapsed_ms
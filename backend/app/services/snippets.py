@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import codecs
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+
+STOPWORDS = {
+    "c", "ce", "cet", "cette", "ces",
+    "est", "quoi", "que", "qui", "comment", "pourquoi",
+    "un", "une", "des", "le", "la", "les",
+    "de", "du", "d", "a", "au", "aux", "en", "pour", "sur",
+}
+
+# letters (accented included) and digits; the old [A-Za-z0-9]+ split "modèle" in two
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+def _fold_table() -> bytes:
+    # bytes.translate table over Latin-1: lowercase without accents ("É" -> "e"),
+    # and a space for every byte that can't be part of a word (same words as \b)
+    table = bytearray(b" " * 256)
+    for code in range(256):
+        c = chr(code)
+        if c.isalnum() or c == "_":
+            base = unicodedata.normalize("NFD", c)[0].lower()
+            table[code] = ord(base) if len(base) == 1 and base.isascii() else code
+    table[0x80] = 0x80  # _fold_char() for letters outside Latin-1
+    return bytes(table)
+
+_FOLD = _fold_table()
+
+@lru_cache(maxsize=4096)
+def _fold_char(c: str) -> str:
+    if not c.isalnum():
+        return " "
+    # "ő" -> "o" like Latin-1 accents; no ASCII base ("œ", "ł", CJK): one word byte
+    base = unicodedata.normalize("NFKD", c)[0]
+    return base if base.isascii() and base.isalnum() else "\x80"
+
+def _fold_error(exc: UnicodeEncodeError) -> tuple[str, int]:
+    return "".join(map(_fold_char, exc.object[exc.start:exc.end])), exc.end
+
+codecs.register_error("snippets.fold", _fold_error)
+
+def fold(text: str) -> bytes:
+    """
+    Case and accent folding done in C: French fits in Latin-1, so encode, then
+    bytes.translate. One byte per char, so positions in the result are positions
+    in `text`; chars outside Latin-1 stay one byte too ("œ" is still a letter).
+    """
+    return text.encode("latin-1", "snippets.fold").translate(_FOLD)
+
+_STOPWORDS_FOLDED = {fold(w) for w in STOPWORDS}
+
+@dataclass(frozen=True)
+class QueryTerms:
+    weights: dict[bytes, int]  # folded term -> weight
+    # b" term": words are separated by spaces in fold(), so a term matches at the
+    # start of a word only ("RAG" not inside "fragment"), suffixes included
+    # ("modèle" in "modèles")
+    needles: tuple[bytes, ...] = ()
+    # per term, in the order of `needles`: length of the term, weight
+    lengths: tuple[int, ...] = ()
+    weight_list: tuple[int, ...] = ()
+
+def compile_query(query: str) -> QueryTerms:
+    """
+    Tokenize, filter and fold the query once per request: each chunk then costs
+    one fold() and C-speed find() calls.
+    Tokens with digits or acronyms (BM25, RAG, FAISS) weigh more than plain words.
+    """
+    weights: dict[bytes, int] = {}
+    for t in TOKEN_RE.findall(query):
+        if len(t) < 3:
+            continue
+        term = fold(t)
+        if term in _STOPWORDS_FOLDED:
+            continue
+        # tokens are letters and digits: not isalpha() means it has a digit
+        w = 2 if (not t.isalpha() or t.isupper()) else 1
+        if w > weights.get(term, 0):
+            weights[term] = w
+    # shortest first: a term and its prefix ("modele", "modeles") match at the same
+    # position, and sorted matches must end in order for the sweep in _best_span()
+    weights = dict(sorted(weights.items(), key=lambda kv: len(kv[0])))
+    return QueryTerms(
+        weights=weights,
+        needles=tuple(b" " + t for t in weights),
+        lengths=tuple(map(len, weights)),
+        weight_list=tuple(weights.values()),
+    )
+
+def _best_span(keys: list[int], terms: QueryTerms, bits: int, window: int) -> tuple[int, int]:
+    """
+    Two-pointer sweep over every occurrence (`keys` sorted, position << bits | term):
+    span of the window with the highest weight of distinct terms, then of matches.
+    """
+    mask = (1 << bits) - 1
+    lengths = terms.lengths
+    # window start relative to the start of a term (not after it if the term is longer)
+    back = [min(n, window) - window for n in lengths]
+    # score = distinct << 16 | total: adding a term that's new in the window adds both
+    again = terms.weight_list
+    fresh = [(w << 16) + w for w in again]
+    counts = [0] * len(again)
+    best = score = left = 0
+    best_span = (0, 0)
+    for key in keys:
+        t = key & mask
+        c = counts[t]
+        counts[t] = c + 1
+        score += again[t] if c else fresh[t]
+        # drop the occurrences that start before the window ending here
+        lo = ((key >> bits) + back[t]) << bits
+        while keys[left] < lo:
+            t = keys[left] & mask
+            c = counts[t] - 1
+            counts[t] = c
+            score -= again[t] if c else fresh[t]
+            left += 1
+        if score > best:
+            best = score
+            best_span = (keys[left], key)
+    start, last = best_span
+    return start >> bits, (last >> bits) + lengths[last & mask]
+
+def make_snippet(text: str, query: str | QueryTerms, window: int = 240) -> str:
+    terms = compile_query(query) if isinstance(query, str) else query
+
+    if terms.needles:
+        # a space before the text so that " term" also matches at its start; a
+        # position in `padded` is then the position of the term in `text`
+        padded = fold(f" {text}")
+        find = padded.find
+        bits = len(terms.needles).bit_length()
+        keys: list[int] = []
+        for t, needle in enumerate(terms.needles):
+            i = find(needle)
+            while i != -1:
+                keys.append(i << bits | t)
+                i = find(needle, i + 2)
+        if keys:
+            keys.sort()
+            mask = (1 << bits) - 1
+            span_start = keys[0] >> bits
+            span_end = (keys[-1] >> bits) + terms.lengths[keys[-1] & mask]
+            if span_end - span_start > window:
+                span_start, span_end = _best_span(keys, terms, bits, window)
+            # center the matched span in the window
+            start = max(0, (span_start + span_end) // 2 - window // 2)
+            end = min(len(text), start + window)
+            start = max(0, end - window)
+            snippet = text[start:end]
+            if start > 0:
+                snippet = "…" + snippet
+            if end < len(text):
+                snippet = snippet + "…"
+            return snippet
+
+    # fallback
+    return (text[:window] + "…") if len(text) > window else text
@@ -0,0 +1,113 @@
+"""
+Burst load test of /v1/chat and /v1/chat/stream, with and without admission control.
+
+    python -m benchmarks.bench_overload --requests 100 --parallel 2 --deadline 2
+
+All requests are sent at once, half of them streaming (interactive priority),
+half to /v1/chat (batch), against a fake Ollama that generates at most
+`--parallel` answers at a time. Without admission control every request is
+accepted and waits in line at the LLM, so latency grows with the burst. With
+it, latency of accepted requests stays bounded by the deadline plus one
+generation, and the others get a fast 503 with Retry-After.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from functools import lru_cache
+
+from benchmarks import corpus, fake_llm
+from benchmarks.run import BACKEND_DIR, ingest, summarize
+
+async def burst(client, queries: list[str], n: int) -> dict:
+    results: dict[str, dict[str, list[float]]] = {
+        endpoint: {"ok": [], "rejected": [], "errors": []} for endpoint in ("stream", "chat")
+    }
+
+    async def one(i: int) -> None:
+        q = queries[i % len(queries)]
+        endpoint = "stream" if i % 2 == 0 else "chat"
+        t0 = time.perf_counter()
+        try:
+            if endpoint == "stream":
+                async with client.stream("GET", "/v1/chat/stream", params={"question": q}) as r:
+                    await r.aread()
+            else:
+                r = await client.post("/v1/chat", json={"question": q})
+            outcome = "ok" if r.status_code == 200 else "rejected" if r.status_code == 503 else "errors"
+        except Exception:  # in-process transport: server errors surface here (e.g. DB pool timeouts)
+            outcome = "errors"
+        results[endpoint][outcome].append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    wall = time.perf_counter() - t0
+
+    out: dict = {"requests": n, "wall_s": round(wall, 2)}
+    for endpoint, outcomes in results.items():
+        out[endpoint] = {
+            "accepted": summarize(outcomes["ok"]),
+            "rejected": summarize(outcomes["rejected"]),
+            "errors": len(outcomes["errors"]),
+        }
+    return out
+
+async def run(args: argparse.Namespace) -> list[dict]:
+    import httpx
+
+    from app.db.init_db import init_db
+    from app.main import app
+    from app.services.admission import get_gate
+
+    init_db()
+    queries = corpus.make_queries(50, seed=args.seed + 1)
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        await ingest(client, corpus.make_corpus(args.docs, seed=args.seed), start=0)
+        for admission in ("off", "on"):
+            os.environ["ADMISSION_ENABLED"] = "1" if admission == "on" else "0"
+            get_gate.cache_clear()
+            r = {"bench": "overload", "admission": admission, **await burst(client, queries, args.requests)}
+            results.append(r)
+            print(json.dumps(r))
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="requests in the burst")
+    parser.add_argument("--docs", type=int, default=50, help="documents in the corpus")
+    parser.add_argument("--parallel", type=int, default=2, help="answers the fake LLM generates at the same time")
+    parser.add_argument("--deadline", type=float, default=2.0, help="ADMISSION_DEADLINE_S")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="fake LLM time per token")
+    parser.add_argument("--first-token-ms", type=float, default=100.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+
+    server = fake_llm.start(token_ms=args.token_ms, first_token_ms=args.first_token_ms, parallel=args.parallel)
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{server.server_port}"
+    os.environ["LLM_PROVIDER"] = "ollama"
+    os.environ["ADMISSION_DEADLINE_S"] = str(args.deadline)
+    os.environ.setdefault("ADMISSION_LLM_CONCURRENCY", str(args.parallel))
+
+    # the app uses paths relative to the working directory (data/...): isolate them
+    os.chdir(tempfile.mkdtemp(prefix="rag-bench-"))
+
+    from app.services import embeddings
+
+    embedder = corpus.HashingEmbedder()
+    embeddings._load_embedder = lru_cache(maxsize=2)(lambda model_name, backend: embedder)
+
+    asyncio.run(run(args))
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
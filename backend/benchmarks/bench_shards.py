@@ -0,0 +1,106 @@
+"""
+Search latency and throughput of the sharded index by shard count and search threads.
+
+    python -m benchmarks.bench_shards --n 1000000 --shards 1 2 4 8 --clients 1 4
+    taskset -c 0-3 python -m benchmarks.bench_shards ...   # restrict to 4 cores
+
+Each configuration runs `--queries` single-vector searches from `--clients`
+concurrent threads (like concurrent /v1/search requests) and reports latency
+percentiles and queries per second. FAISS OpenMP is pinned to 1 thread so
+that parallelism only comes from the shard fan-out.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from app.services import faiss_index
+from app.services.faiss_index import ShardedIndex
+from benchmarks.bench_vector_storage import make_queries, make_vectors
+
+def build(base: np.ndarray, n_shards: int, storage: str, train: int) -> ShardedIndex:
+    # built in memory only: the root directory is never written
+    root = Path(tempfile.gettempdir()) / "bench-shards"
+    index = ShardedIndex.create(root, base.shape[1], n_shards=n_shards, storage=storage)
+    if not index.shards[0].is_trained:
+        # sq8: trained on the first vectors, as the app trains it on the first batch it indexes
+        template = faiss_index.create_index(base.shape[1], storage)
+        faiss_index.train_index(template, base[:train])
+        index.shards = [faiss.IndexIDMap2(faiss.clone_index(template)) for _ in range(n_shards)]
+    # synthetic documents of 20 chunks, spread over shards like real uploads
+    doc_of = np.arange(base.shape[0]) // 20
+    shard_of = np.array([faiss_index.shard_for(str(d), n_shards) for d in range(doc_of[-1] + 1)])[doc_of]
+    for shard in range(n_shards):
+        rows = np.flatnonzero(shard_of == shard)
+        # straight into the in-memory shard, bypassing the on-disk log
+        index.shards[shard].add_with_ids(base[rows], rows.astype("int64"))
+    return index
+
+def run(index: ShardedIndex, queries: np.ndarray, k: int, clients: int) -> dict:
+    def one(i: int) -> float:
+        t0 = time.perf_counter()
+        index.search(queries[i], top_k=k)
+        return (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        lat = np.array(list(pool.map(one, range(queries.shape[0]))))
+    wall = time.perf_counter() - t0
+    return {
+        "search_ms_p50": round(float(np.percentile(lat, 50)), 3),
+        "search_ms_p95": round(float(np.percentile(lat, 95)), 3),
+        "qps": round(queries.shape[0] / wall, 1),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--storage", default="flat")
+    parser.add_argument("--train", type=int, default=256, help="vectors sq8 is trained on (first batch added)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(1)
+    base = make_vectors(args.n, args.dim)
+    queries = make_queries(base, args.queries)
+
+    results = []
+    for n_shards in args.shards:
+        index = build(base, n_shards, args.storage, args.train)
+        # one search thread per shard, capped by the cores available
+        faiss_index._get_executor.cache_clear()
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+        os.environ["FAISS_SEARCH_THREADS"] = str(min(n_shards, cores))
+        for clients in args.clients:
+            r = {
+                "n": args.n,
+                "shards": n_shards,
+                "threads": int(os.environ["FAISS_SEARCH_THREADS"]),
+                "clients": clients,
+                "cores": cores,
+                **run(index, queries, args.k, clients),
+            }
+            results.append(r)
+            print(json.dumps(r))
+        del index
+
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Micro-benchmark of citation snippet extraction, per chat request (5 hits of ~900 chars).
+
+    python -m benchmarks.bench_snippets --requests 2000
+
+`legacy` is the previous implementation (query tokenized for every hit, one
+`find` per token over the lowercased chunk), kept here as the baseline.
+Both run `--repeat` times, interleaved; the minimum is the least noisy figure.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import time
+
+from app.services.snippets import STOPWORDS, compile_query, make_snippet
+from benchmarks import corpus
+
+def legacy_make_snippet(text: str, query: str, window: int = 240) -> str:
+    # verbatim copy of make_snippet from chat.py before the snippets module
+    raw = re.findall(r"[A-Za-z0-9]+", query)
+    tokens = []
+    for t in raw:
+        tl = t.lower()
+        if len(t) < 3:
+            continue
+        if tl in STOPWORDS:
+            continue
+        tokens.append(t)
+
+    # dédoublonnage + priorisation:
+    # 1) tokens avec chiffres ou acronyme (BM25, RAG, FAISS)
+    # 2) tokens longs
+    uniq = list(dict.fromkeys(tokens))  # garde l'ordre
+    def score(t: str) -> tuple[int, int]:
+        has_digit = any(ch.isdigit() for ch in t)
+        is_acronym = t.isupper()
+        return (1 if (has_digit or is_acronym) else 0, len(t))
+
+    uniq.sort(key=lambda t: score(t), reverse=True)
+
+    lower = text.lower()
+    for tok in uniq:
+        i = lower.find(tok.lower())
+        if i != -1:
+            start = max(0, i - window // 2)
+            end = min(len(text), start + window)
+            snippet = text[start:end]
+            if start > 0:
+                snippet = "…" + snippet
+            if end < len(text):
+                snippet = snippet + "…"
+            return snippet
+
+    # fallback
+    return (text[:window] + "…") if len(text) > window else text
+
+def per_request_us(fn, requests: list[tuple[str, list[str]]]) -> float:
+    t0 = time.perf_counter()
+    for question, hits in requests:
+        fn(question, hits)
+    return (time.perf_counter() - t0) / len(requests) * 1e6
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--hits", type=int, default=5)
+    parser.add_argument("--chunk-chars", type=int, default=900)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    docs = corpus.make_corpus(args.requests * args.hits, chars=args.chunk_chars)
+    questions = corpus.make_queries(args.requests)
+    requests = [(q, docs[i * args.hits:(i + 1) * args.hits]) for i, q in enumerate(questions)]
+
+    def legacy(question: str, hits: list[str]) -> None:
+        for h in hits:
+            legacy_make_snippet(h, question)
+
+    def current(question: str, hits: list[str]) -> None:
+        terms = compile_query(question)
+        for h in hits:
+            make_snippet(h, terms)
+
+    impls = {"legacy": legacy, "current": current}
+    runs: dict[str, list[float]] = {name: [] for name in impls}
+    for _ in range(args.repeat):
+        for name, fn in impls.items():
+            runs[name].append(per_request_us(fn, requests))
+    for name, us in runs.items():
+        us.sort()
+        print(json.dumps({
+            "impl": name,
+            "hits": args.hits,
+            "us_per_request": round(us[0], 1),
+            "median_us": round(us[len(us) // 2], 1),
+        }))
+
+if __name__ == "__main__":
+    main()
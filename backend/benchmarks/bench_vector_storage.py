@@ -0,0 +1,102 @@
+"""
+Memory footprint, search latency and recall loss of the FAISS storage options.
+
+    python -m benchmarks.bench_vector_storage --sizes 100000 1000000 --out results/storage.json
+
+Vectors are synthetic (clustered, L2-normalized, MiniLM dimension). Recall@k is
+measured against the exact float32 index on the same data. Like the app, sq8
+learns its range from the first vectors added (`--train` of them).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from app.services.faiss_index import create_index, train_index
+
+STORAGES = ["flat", "fp16", "sq8"]
+
+def make_vectors(n: int, dim: int, n_clusters: int = 256, seed: int = 0) -> np.ndarray:
+    # clustered data looks more like real embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    x = centers[labels] + 0.6 * rng.standard_normal((n, dim), dtype=np.float32)
+    faiss.normalize_L2(x)
+    return x
+
+def make_queries(base: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    picks = base[rng.integers(0, base.shape[0], size=n)]
+    q = picks + 0.3 * rng.standard_normal(picks.shape, dtype=np.float32) / np.sqrt(base.shape[1])
+    q = np.ascontiguousarray(q, dtype=np.float32)
+    faiss.normalize_L2(q)
+    return q
+
+def bench_storage(storage: str, base: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int, train: int) -> dict:
+    index = create_index(base.shape[1], storage)
+    train_index(index, base[:train])
+    t0 = time.perf_counter()
+    index.add(base)
+    add_s = time.perf_counter() - t0
+
+    # one query at a time, like the /v1/search endpoint
+    latencies = []
+    found = np.empty((queries.shape[0], k), dtype=np.int64)
+    for i in range(queries.shape[0]):
+        t0 = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        found[i] = ids[0]
+
+    recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(queries.shape[0])])
+    lat = np.array(latencies)
+    return {
+        "storage": storage,
+        "n": int(base.shape[0]),
+        "dim": int(base.shape[1]),
+        "bytes": int(index.sa_code_size() * index.ntotal),
+        "add_s": round(add_s, 3),
+        "search_ms_p50": round(float(np.percentile(lat, 50)), 3),
+        "search_ms_p95": round(float(np.percentile(lat, 95)), 3),
+        f"recall_at_{k}": round(float(recall), 4),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--train", type=int, default=256, help="vectors sq8 is trained on (first batch added)")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    results = []
+    for n in args.sizes:
+        base = make_vectors(n, args.dim)
+        queries = make_queries(base, args.queries)
+        exact = faiss.IndexFlatIP(args.dim)
+        exact.add(base)
+        _, truth = exact.search(queries, args.k)
+        del exact
+
+        for storage in STORAGES:
+            r = bench_storage(storage, base, queries, truth, args.k, args.train)
+            results.append(r)
+            print(json.dumps(r))
+
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Compare two result files written by benchmarks.run.
+
+    python -m benchmarks.compare benchmarks/results/main.json benchmarks/results/branch.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+
+# identify a measurement across runs
+KEYS = ("bench", "corpus_docs", "concurrency", "batch_size")
+# lower is better for these, higher for the others (throughputs)
+LOWER_IS_BETTER = ("_ms", "errors")
+
+def flatten(result: dict, prefix: str = "") -> dict[str, float]:
+    out: dict[str, float] = {}
+    for k, v in result.items():
+        if k in KEYS:
+            continue
+        if isinstance(v, dict):
+            out.update(flatten(v, f"{prefix}{k}."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[f"{prefix}{k}"] = float(v)
+    return out
+
+def key_of(result: dict) -> str:
+    return " ".join(f"{k}={result[k]}" for k in KEYS if k in result)
+
+def load(path: str) -> tuple[dict, dict[str, dict[str, float]]]:
+    report = json.loads(Path(path).read_text(encoding="utf-8"))
+    return report["environment"], {key_of(r): flatten(r) for r in report["results"]}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="flag changes above this percentage")
+    args = parser.parse_args()
+
+    base_env, base = load(args.base)
+    new_env, new = load(args.new)
+    print(f"base: {base_env['version']} ({base_env['timestamp']})")
+    print(f"new:  {new_env['version']} ({new_env['timestamp']})")
+
+    for key in base:
+        if key not in new:
+            continue
+        print(f"\n{key}")
+        for metric, old in base[key].items():
+            if metric not in new[key] or metric.endswith(("count", "chunks", "docs")):
+                continue
+            cur = new[key][metric]
+            delta = (cur - old) / old * 100 if old else 0.0
+            worse = delta > 0 if metric.endswith(LOWER_IS_BETTER) else delta < 0
+            flag = "  <-- regression" if worse and abs(delta) >= args.threshold else ""
+            print(f"  {metric:<20} {old:>12.2f} {cur:>12.2f} {delta:>+8.1f}%{flag}")
+
+if __name__ == "__main__":
+    main()
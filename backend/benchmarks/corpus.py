@@ -0,0 +1,58 @@
+"""
+Deterministic synthetic corpora and a bag-of-words embedder for the benchmarks.
+"""
+from __future__ import annotations
+
+import random
+import re
+import zlib
+
+import numpy as np
+
+# mixed French/English vocabulary, with accents and acronyms like the real documents
+VOCAB = (
+    "index recherche document modèle réponse contexte requête vecteur données "
+    "système utilisateur fichier résultat qualité évaluation latence mémoire "
+    "entreprise procédure sécurité réseau serveur client déploiement version "
+    "analyse rapport équipe projet budget délai contrat facture paiement "
+    "RAG FAISS BM25 API LLM SQL HTTP GPU CPU ONNX "
+    "search embedding chunk retrieval ranking prompt answer citation snippet"
+).split()
+
+def make_document(doc_id: int, chars: int, seed: int = 0) -> str:
+    rng = random.Random(seed * 1_000_003 + doc_id)
+    words: list[str] = []
+    size = 0
+    while size < chars:
+        sentence = " ".join(rng.choice(VOCAB) for _ in range(rng.randint(6, 18)))
+        sentence = sentence[0].upper() + sentence[1:] + ". "
+        words.append(sentence)
+        size += len(sentence)
+    return "".join(words)[:chars]
+
+def make_corpus(n_docs: int, chars: int = 4000, seed: int = 0) -> list[str]:
+    return [make_document(i, chars, seed) for i in range(n_docs)]
+
+def make_queries(n: int, seed: int = 1) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(VOCAB) for _ in range(rng.randint(3, 8))) for _ in range(n)]
+
+class HashingEmbedder:
+    """
+    Feature-hashing stand-in for SentenceTransformer (same `encode` signature).
+    Texts sharing words get a positive cosine, so retrieval and the chat guardrail
+    behave as with a real model, without downloading or running one.
+    """
+
+    def __init__(self, dim: int = 384) -> None:
+        self.dim = dim
+
+    def encode(self, texts: list[str], normalize_embeddings: bool = True, convert_to_numpy: bool = True, **_) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for tok in re.findall(r"\w+", text.lower()):
+                out[row, zlib.crc32(tok.encode("utf-8")) % self.dim] += 1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            out /= np.maximum(norms, 1e-12)
+        return out
@@ -0,0 +1,88 @@
+"""
+Local stand-in for the Ollama /api/generate endpoint, with a fixed time per token.
+
+    python -m benchmarks.fake_llm --port 11500 --token-ms 20
+    OLLAMA_URL=http://127.0.0.1:11500 uvicorn app.main:app
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "Le document indique que la réponse se trouve dans le contexte fourni [1]."
+
+class _Handler(BaseHTTPRequestHandler):
+    token_ms = 20.0
+    first_token_ms = 100.0
+    # like OLLAMA_NUM_PARALLEL: requests past it wait for a free slot (None: unlimited)
+    slots: threading.Semaphore | None = None
+
+    def log_message(self, format, *args) -> None:  # noqa: A002
+        pass
+
+    def do_POST(self) -> None:
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.slots is None:
+            self._generate(body)
+            return
+        with self.slots:
+            self._generate(body)
+
+    def _generate(self, body: dict) -> None:
+        tokens = [t + " " for t in ANSWER.split()]
+
+        time.sleep(self.first_token_ms / 1000)
+        if not body.get("stream", True):
+            time.sleep(self.token_ms * len(tokens) / 1000)
+            payload = json.dumps({"model": body.get("model"), "response": "".join(tokens), "done": True}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        # HTTP/1.0 without Content-Length: the body ends when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for tok in tokens:
+            self.wfile.write(json.dumps({"response": tok, "done": False}).encode() + b"\n")
+            self.wfile.flush()
+            time.sleep(self.token_ms / 1000)
+        self.wfile.write(json.dumps({"response": "", "done": True}).encode() + b"\n")
+
+def start(port: int = 0, token_ms: float = 20.0, first_token_ms: float = 100.0, parallel: int = 0) -> ThreadingHTTPServer:
+    """
+    Start the server in a daemon thread; the URL is http://127.0.0.1:<server.server_port>.
+    `parallel` > 0 limits the requests generating at the same time.
+    """
+    slots = threading.Semaphore(parallel) if parallel > 0 else None
+    handler = type("Handler", (_Handler,), {"token_ms": token_ms, "first_token_ms": first_token_ms, "slots": slots})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    parser.add_argument("--first-token-ms", type=float, default=100.0)
+    parser.add_argument("--parallel", type=int, default=0, help="requests generated at the same time (0: unlimited)")
+    args = parser.parse_args()
+    server = start(args.port, args.token_ms, args.first_token_ms, args.parallel)
+    print(f"fake Ollama on http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
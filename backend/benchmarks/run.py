@@ -0,0 +1,243 @@
+"""
+Reproducible benchmark of ingestion, search and chat.
+
+    python -m benchmarks.run --sizes 100 1000 --concurrency 1 8 32 --out benchmarks/results/main.json
+    python -m benchmarks.compare benchmarks/results/main.json benchmarks/results/branch.json
+
+Runs against the FastAPI app in-process (httpx ASGI transport), in a temporary
+working directory with a fresh SQLite DB and index. `--sizes` are cumulative
+corpus sizes in documents: at each size the missing documents are uploaded and
+indexed through the API, then /v1/search and /v1/chat are measured at each
+concurrency level. /v1/chat talks to a local fake Ollama server with a fixed
+time per token, so its numbers are the RAG overhead plus that fixed cost.
+
+By default embeddings come from a bag-of-words hashing embedder, to measure the
+pipeline without model inference; `--embedder model` uses the real model
+(EMBEDDING_MODEL / EMBEDDING_BACKEND apply).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime as dt
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks import corpus, fake_llm
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+def summarize(latencies_ms: list[float]) -> dict:
+    if not latencies_ms:
+        return {}
+    lat = np.array(latencies_ms)
+    return {
+        "count": len(latencies_ms),
+        "mean_ms": round(float(lat.mean()), 2),
+        "p50_ms": round(float(np.percentile(lat, 50)), 2),
+        "p95_ms": round(float(np.percentile(lat, 95)), 2),
+        "p99_ms": round(float(np.percentile(lat, 99)), 2),
+        "max_ms": round(float(lat.max()), 2),
+    }
+
+async def run_load(call: Callable[[int], Awaitable[bool]], n: int, concurrency: int) -> dict:
+    """
+    Run `n` calls with at most `concurrency` in flight. `call` returns False on error.
+    """
+    sem = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            ok = await call(i)
+            if ok:
+                latencies.append((time.perf_counter() - t0) * 1000)
+            else:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    wall = time.perf_counter() - t0
+    return {**summarize(latencies), "errors": errors, "rps": round(n / wall, 2)}
+
+def bench_chunking(texts: list[str]) -> dict:
+    from app.services.chunking import chunk_text
+
+    t0 = time.perf_counter()
+    n_chunks = sum(len(chunk_text(t)) for t in texts)
+    elapsed = time.perf_counter() - t0
+    return {
+        "bench": "chunking",
+        "docs": len(texts),
+        "chunks": n_chunks,
+        "chars_per_s": round(sum(len(t) for t in texts) / elapsed),
+        "chunks_per_s": round(n_chunks / elapsed),
+    }
+
+def bench_embedding(texts: list[str], batch_sizes: list[int]) -> list[dict]:
+    from app.services.chunking import chunk_text
+    from app.services.embeddings import embed_texts, get_active_model
+
+    chunks = [c.text for t in texts for c in chunk_text(t)]
+    results = []
+    for bs in batch_sizes:
+        t0 = time.perf_counter()
+        for i in range(0, len(chunks), bs):
+            embed_texts(chunks[i:i + bs], model_name=get_active_model())
+        elapsed = time.perf_counter() - t0
+        results.append({"bench": "embedding", "batch_size": bs, "chunks": len(chunks), "chunks_per_s": round(len(chunks) / elapsed, 1)})
+    return results
+
+async def ingest(client, texts: list[str], start: int) -> dict:
+    upload_ms: list[float] = []
+    index_ms: list[float] = []
+    n_chunks = 0
+    t0 = time.perf_counter()
+    for i, text in enumerate(texts, start=start):
+        t = time.perf_counter()
+        r = await client.post("/v1/documents", files={"file": (f"doc_{i}.txt", text.encode("utf-8"), "text/plain")})
+        r.raise_for_status()
+        upload_ms.append((time.perf_counter() - t) * 1000)
+
+        t = time.perf_counter()
+        r = await client.post(f"/v1/documents/{r.json()['id']}/index")
+        r.raise_for_status()
+        index_ms.append((time.perf_counter() - t) * 1000)
+        n_chunks += r.json()["indexed"]
+    elapsed = time.perf_counter() - t0
+    return {
+        "bench": "ingest",
+        "docs": len(texts),
+        "chunks": n_chunks,
+        "docs_per_s": round(len(texts) / elapsed, 2),
+        "chunks_per_s": round(n_chunks / elapsed, 1),
+        "upload": summarize(upload_ms),
+        "index": summarize(index_ms),
+    }
+
+async def bench_endpoint(client, endpoint: str, queries: list[str], n: int, concurrency: int) -> dict:
+    async def call(i: int) -> bool:
+        q = queries[i % len(queries)]
+        if endpoint == "search":
+            r = await client.post("/v1/search", json={"query": q, "top_k": 5})
+        else:
+            r = await client.post("/v1/chat", json={"question": q, "top_k": 5})
+        return r.status_code == 200
+
+    return {"bench": endpoint, "concurrency": concurrency, **await run_load(call, n, concurrency)}
+
+def git_version() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def environment(args: argparse.Namespace) -> dict:
+    import faiss
+
+    knobs = ["EMBEDDING_MODEL", "EMBEDDING_BACKEND", "FAISS_STORAGE", "FAISS_SHARDS", "FAISS_SEARCH_THREADS", "RERANK_ENABLED"]
+    return {
+        "version": git_version(),
+        "timestamp": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "faiss": faiss.__version__,
+        "env": {k: os.environ[k] for k in knobs if k in os.environ},
+        "args": vars(args),
+    }
+
+async def run(args: argparse.Namespace) -> list[dict]:
+    import httpx
+
+    from app.db.init_db import init_db
+    from app.main import app
+
+    init_db()
+    texts = corpus.make_corpus(max(args.sizes), chars=args.doc_chars, seed=args.seed)
+    queries = corpus.make_queries(200, seed=args.seed + 1)
+
+    results: list[dict] = [bench_chunking(texts)]
+    print(json.dumps(results[-1]))
+    for r in bench_embedding(texts[: args.embed_docs], args.batch_sizes):
+        results.append(r)
+        print(json.dumps(r))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        done = 0
+        for size in sorted(args.sizes):
+            r = {**await ingest(client, texts[done:size], start=done), "corpus_docs": size}
+            results.append(r)
+            print(json.dumps(r))
+            done = size
+
+            for endpoint in ("search", "chat"):
+                n = args.requests if endpoint == "search" else args.chat_requests
+                for concurrency in args.concurrency:
+                    r = {**await bench_endpoint(client, endpoint, queries, n, concurrency), "corpus_docs": size}
+                    results.append(r)
+                    print(json.dumps(r))
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000], help="cumulative corpus sizes (documents)")
+    parser.add_argument("--doc-chars", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=500, help="search requests per concurrency level")
+    parser.add_argument("--chat-requests", type=int, default=100, help="chat requests per concurrency level")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 64, 256])
+    parser.add_argument("--embed-docs", type=int, default=50, help="documents used by the embedding benchmark")
+    parser.add_argument("--embedder", choices=["hash", "model"], default="hash")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="fake LLM time per token")
+    parser.add_argument("--first-token-ms", type=float, default=100.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    out = Path(args.out).resolve() if args.out else None
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+
+    server = fake_llm.start(token_ms=args.token_ms, first_token_ms=args.first_token_ms)
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{server.server_port}"
+    os.environ["LLM_PROVIDER"] = "ollama"
+
+    # the app uses paths relative to the working directory (data/...): isolate them
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    os.chdir(workdir)
+
+    if args.embedder == "hash":
+        from app.services import embeddings
+
+        embedder = corpus.HashingEmbedder()
+        embeddings._load_embedder = lru_cache(maxsize=2)(lambda model_name, backend: embedder)
+
+    report = {"environment": environment(args), "results": asyncio.run(run(args))}
+    server.shutdown()
+
+    if out:
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"results written to {out}")
+
+if __name__ == "__main__":
+    main()
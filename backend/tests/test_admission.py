@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.admission import BATCH, INTERACTIVE, Gate, Overloaded, request_priority
+
+def deadline(seconds: float = 5.0) -> float:
+    return time.monotonic() + seconds
+
+def test_waiters_are_served_by_priority_then_arrival():
+    async def scenario() -> list[str]:
+        gate = Gate("llm", limit=1, max_queue=10)
+        order: list[str] = []
+        first = await gate.acquire(BATCH, deadline())
+
+        async def worker(name: str, priority: int) -> None:
+            async with gate.slot(priority, deadline()):
+                order.append(name)
+
+        tasks = [
+            asyncio.create_task(worker("batch-1", BATCH)),
+            asyncio.create_task(worker("batch-2", BATCH)),
+            asyncio.create_task(worker("interactive", INTERACTIVE)),
+        ]
+        await asyncio.sleep(0)
+        assert gate.queued == 3
+        first.release()
+        await asyncio.gather(*tasks)
+        assert gate.active == 0
+        return order
+
+    assert asyncio.run(scenario()) == ["interactive", "batch-1", "batch-2"]
+
+def test_full_queue_rejects_or_preempts_lower_priority():
+    async def scenario() -> None:
+        gate = Gate("llm", limit=1, max_queue=1)
+        slot = await gate.acquire(BATCH, deadline())
+        waiting = asyncio.create_task(gate.acquire(BATCH, deadline()))
+        await asyncio.sleep(0)
+
+        with pytest.raises(Overloaded) as e:
+            await gate.acquire(BATCH, deadline())
+        assert e.value.reason == "queue_full" and e.value.retry_after >= 1
+
+        # an interactive request takes the queued batch request's place
+        interactive = asyncio.create_task(gate.acquire(INTERACTIVE, deadline()))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await waiting
+        slot.release()
+        (await interactive).release()
+        assert gate.active == 0
+
+    asyncio.run(scenario())
+
+def test_request_that_cannot_start_before_its_deadline_is_rejected():
+    async def scenario() -> None:
+        gate = Gate("retrieval", limit=1, max_queue=10)
+        slot = await gate.acquire(BATCH, deadline())
+
+        t0 = time.monotonic()
+        with pytest.raises(Overloaded) as e:
+            await gate.acquire(BATCH, deadline(0.05))
+        assert e.value.reason == "deadline"
+        assert time.monotonic() - t0 < 1
+        assert gate.queued == 0
+
+        # the slot freed after a timeout is not lost
+        slot.release()
+        (await gate.acquire(BATCH, deadline())).release()
+        assert gate.active == 0
+
+    asyncio.run(scenario())
+
+def test_priority_header_overrides_endpoint_default():
+    assert request_priority(None, INTERACTIVE) == INTERACTIVE
+    assert request_priority("batch", INTERACTIVE) == BATCH
+    assert request_priority("Interactive", BATCH) == INTERACTIVE
+    assert request_priority("urgent", BATCH) == BATCH
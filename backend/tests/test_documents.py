@@ -0,0 +1,106 @@
+import datetime as dt
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.routes import documents
+from app.db.database import Base
+from app.db.deps import get_db
+from app.db.models import Chunk, Document
+from app.main import app
+
+@pytest.fixture()
+def client(monkeypatch):
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    TestSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = TestSession()
+    t0 = dt.datetime(2024, 1, 1)
+    for i in range(5):
+        db.add(Document(id=f"doc-{i}", filename=f"f{i}.txt", content_type="text/plain",
+                        storage_path="x", created_at=t0 + dt.timedelta(minutes=i // 2)))
+    for i in range(7):
+        db.add(Chunk(document_id="doc-0", chunk_index=i, text=f"chunk {i}", start_char=i, end_char=i + 1))
+    db.commit()
+    db.close()
+
+    def override_get_db():
+        session = TestSession()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    monkeypatch.setattr(documents, "SessionLocal", TestSession)
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+def test_list_documents_keyset_pages_cover_all_rows_once(client):
+    ids = []
+    cursor = None
+    while True:
+        params = {"limit": 2, "fields": "id"}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get("/v1/documents", params=params)
+        assert r.status_code == 200
+        ids += [d["id"] for d in r.json()]
+        assert all(set(d) == {"id"} for d in r.json())
+        cursor = r.headers.get("x-next-cursor")
+        if not cursor:
+            break
+
+    # newest first, ties on created_at broken by id
+    assert ids == ["doc-4", "doc-3", "doc-2", "doc-1", "doc-0"]
+
+def test_list_documents_without_limit_returns_full_objects(client):
+    r = client.get("/v1/documents")
+
+    assert len(r.json()) == 5
+    assert "x-next-cursor" not in r.headers
+    assert set(r.json()[0]) == {"id", "filename", "content_type", "storage_path", "created_at"}
+
+def test_list_chunks_pagination_and_field_selection(client):
+    r = client.get("/v1/documents/doc-0/chunks", params={"limit": 4, "fields": "chunk_index,start_char"})
+    assert [c["chunk_index"] for c in r.json()] == [0, 1, 2, 3]
+    assert "text" not in r.json()[0]
+
+    r = client.get("/v1/documents/doc-0/chunks", params={"limit": 4, "cursor": r.headers["x-next-cursor"]})
+    assert [c["chunk_index"] for c in r.json()] == [4, 5, 6]
+    assert "x-next-cursor" not in r.headers
+
+def test_unknown_field_and_bad_cursor_are_rejected(client):
+    assert client.get("/v1/documents", params={"fields": "secret"}).status_code == 400
+    assert client.get("/v1/documents", params={"cursor": "not-a-cursor"}).status_code == 400
+
+    # well-formed cursors with values of the wrong type
+    for path, values in [
+        ("/v1/documents/doc-0/chunks", [{"a": 1}]),
+        ("/v1/documents/doc-0/chunks", [[1]]),
+        ("/v1/documents/doc-0/chunks", [None]),
+        ("/v1/documents/doc-0/chunks", ["abc"]),
+        ("/v1/documents/doc-0/chunks", [True]),
+        ("/v1/documents", ["2024-01-01", {"a": 1}]),
+        ("/v1/documents", ["2024-01-01", None]),
+        ("/v1/documents", [20240101, "doc-1"]),
+        ("/v1/documents", ["not a date", "doc-1"]),
+    ]:
+        r = client.get(path, params={"cursor": documents.encode_cursor(values)})
+        assert r.status_code == 400, (path, values)
+
+def test_export_chunks_streams_ndjson(client):
+    r = client.get("/v1/documents/doc-0/chunks/export", params={"fields": "chunk_index,text"})
+
+    assert r.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert lines[0] == {"chunk_index": 0, "text": "chunk 0"}
+    assert len(lines) == 7
+    assert client.get("/v1/documents/missing/chunks/export").status_code == 404
@@ -0,0 +1,139 @@
+import threading
+import time
+
+import faiss
+import numpy as np
+import pytest
+
+from app.services.faiss_index import ShardedIndex, _RWLock, shard_for
+
+def _unit(rows: int, dim: int, seed: int) -> np.ndarray:
+    x = np.random.default_rng(seed).standard_normal((rows, dim)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+def test_sharded_search_merges_top_k_across_shards(tmp_path):
+    vectors = _unit(40, 16, seed=0)
+    index = ShardedIndex.create(tmp_path / "idx", dim=16, n_shards=4, storage="flat")
+    with index.writer():
+        for shard in range(4):
+            rows = list(range(shard, 40, 4))
+            index.add(shard, vectors[rows], [r + 100 for r in rows])
+
+    ids, scores = index.search(vectors[7], top_k=3)
+
+    expected = np.argsort(-(vectors @ vectors[7]))[:3] + 100
+    assert ids == expected.tolist()
+    assert scores == sorted(scores, reverse=True)
+
+def test_writes_only_append_to_the_touched_shard_log(tmp_path):
+    root = tmp_path / "idx"
+    index = ShardedIndex.create(root, dim=8, n_shards=3, storage="flat")
+    shard = shard_for("doc-1", 3)
+    with index.writer():
+        index.add(shard, _unit(2, 8, seed=1), [1, 2])
+
+    assert sorted(p.name for p in root.glob("shard-*")) == [f"shard-{shard:02d}.log"]
+    reloaded = ShardedIndex.load(root)
+    assert reloaded.n_shards == 3
+    assert sorted(reloaded.ids(shard).tolist()) == [1, 2]
+
+def test_reload_replays_log_after_snapshot_and_ignores_torn_record(tmp_path):
+    root = tmp_path / "idx"
+    index = ShardedIndex.create(root, dim=8, n_shards=1, storage="flat")
+    with index.writer():
+        index.add(0, _unit(2, 8, seed=2), [1, 2])
+        index.checkpoint()
+        index.add(0, _unit(1, 8, seed=3), [3])
+        index.remove(0, [1])
+    # simulate a crash in the middle of an append
+    with index.log_path(0).open("ab") as f:
+        f.write(b"A\x00\x01")
+
+    reloaded = ShardedIndex.load(root)
+    assert sorted(reloaded.ids(0).tolist()) == [2, 3]
+
+    with reloaded.writer():
+        reloaded.add(0, _unit(1, 8, seed=4), [4])
+    assert sorted(ShardedIndex.load(root).ids(0).tolist()) == [2, 3, 4]
+
+@pytest.mark.parametrize("storage, min_recall, max_score_error", [("flat", 1.0, 0.0), ("fp16", 0.95, 1e-3), ("sq8", 0.9, 0.02)])
+def test_storage_round_trip(tmp_path, monkeypatch, storage, min_recall, max_score_error):
+    monkeypatch.setenv("FAISS_STORAGE", storage)
+    root = tmp_path / "idx"
+    vectors = _unit(300, 32, seed=5)
+    index = ShardedIndex.create(root, dim=32, n_shards=2)
+    # another worker that created the index before it had any vector
+    other = ShardedIndex.create(root, dim=32, n_shards=2)
+    with index.writer():
+        index.add(0, vectors[:20], list(range(20)))
+        index.add(1, vectors[20:150], list(range(20, 150)))
+        index.checkpoint([0])
+        index.add(0, vectors[150:], list(range(150, 300)))
+    other.refresh()
+
+    queries = _unit(20, 32, seed=6)
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :5]
+    for reloaded in (ShardedIndex.load(root), other):
+        assert reloaded.storage == storage
+        found = 0
+        for q, truth in zip(queries, exact):
+            ids, scores = reloaded.search(q, top_k=5)
+            assert (ids, scores) == index.search(q, top_k=5)
+            found += len(set(ids) & set(truth.tolist()))
+            assert np.abs(np.array(scores) - vectors[ids] @ q).max() <= max_score_error + 1e-6
+        assert found / exact.size >= min_recall
+
+    if storage == "sq8":
+        # the range comes from the vectors, not the whole of [-1, 1]
+        trained = faiss.read_index(str(index.trained_path))
+        vmin, vdiff = faiss.vector_to_array(trained.sq.trained)
+        assert -1 < vmin and vmin + vdiff < 1
+
+def test_sq8_index_of_older_versions_keeps_its_fixed_range(tmp_path):
+    # what older versions wrote: a snapshot trained on [-1, 1] and no trained.index
+    old = faiss.IndexScalarQuantizer(8, faiss.ScalarQuantizer.QT_8bit_uniform, faiss.METRIC_INNER_PRODUCT)
+    old.train(np.array([[-1.0] * 8, [1.0] * 8], dtype="float32"))
+    shard = faiss.IndexIDMap2(old)
+    shard.add_with_ids(_unit(3, 8, seed=7), np.array([1, 2, 3]))
+    root = tmp_path / "idx"
+    root.mkdir()
+    ShardedIndex.create(root, dim=8, n_shards=2, storage="sq8")._write_meta()
+    faiss.write_index(shard, str(root / "shard-00.000000000003.index"))
+
+    index = ShardedIndex.load(root)
+    with index.writer():
+        index.add(1, _unit(3, 8, seed=8), [4, 5, 6])
+
+    trained = faiss.read_index(str(index.trained_path))
+    assert faiss.vector_to_array(trained.sq.trained).tolist() == [-1.0, 2.0]
+    assert sorted(ShardedIndex.load(root).ids(1).tolist()) == [4, 5, 6]
+
+def test_waiting_writer_goes_before_new_readers():
+    lock = _RWLock()
+    order = []
+    lock.acquire_read()
+
+    def write():
+        lock.acquire_write()
+        order.append("write")
+        lock.release_write()
+
+    def read():
+        lock.acquire_read()
+        order.append("read")
+        lock.release_read()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    deadline = time.monotonic() + 5
+    while not lock._writers_waiting and time.monotonic() < deadline:
+        time.sleep(0.001)
+    reader = threading.Thread(target=read)
+    reader.start()
+    time.sleep(0.05)
+    assert order == []  # the new reader doesn't slip past the waiting writer
+
+    lock.release_read()
+    writer.join(5)
+    reader.join(5)
+    assert order == ["write", "read"]
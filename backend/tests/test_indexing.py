@@ -0,0 +1,165 @@
+import threading
+
+import faiss
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.database import Base
+from app.api.routes import index as index_routes
+from app.db.models import Chunk, ChunkVector, Document
+from app.main import app
+from app.services import faiss_index, indexing
+from app.services.faiss_index import ShardedIndex, index_dir_for
+from app.services.indexing import migrate_legacy_index, reconcile_index, reembed_all
+
+MODEL = "test-model"
+
+@pytest.fixture()
+def session_factory(tmp_path, monkeypatch):
+    monkeypatch.setattr(faiss_index, "INDEX_ROOT", tmp_path / "index")
+    monkeypatch.setattr(faiss_index, "INDEX_PATH", tmp_path / "faiss.index")
+    monkeypatch.setattr(faiss_index, "_indexes", {})
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    TestSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = TestSession()
+    db.add(Document(id="doc-0", filename="f.txt", content_type="text/plain", storage_path="x"))
+    db.add_all([Chunk(id=i, document_id="doc-0", chunk_index=i, text=f"chunk {i}") for i in (1, 2)])
+    db.commit()
+    db.close()
+    return TestSession
+
+def _vec(seed: int) -> np.ndarray:
+    x = np.random.default_rng(seed).standard_normal((1, 8)).astype("float32")
+    return x / np.linalg.norm(x)
+
+def _index_chunk(index: ShardedIndex, db, chunk_id: int) -> None:
+    index.add(0, _vec(chunk_id), [chunk_id])
+    db.add(ChunkVector(chunk_id=chunk_id, faiss_id=chunk_id, embedding_model=MODEL))
+    db.commit()
+
+def test_reconcile_keeps_vectors_committed_by_another_worker_meanwhile(session_factory, monkeypatch):
+    root = index_dir_for(MODEL)
+    first = ShardedIndex.create(root, dim=8, n_shards=1, storage="flat")
+    with first.writer():
+        _index_chunk(first, session_factory(), 1)
+
+    # another worker indexes chunk 2 right before reconcile takes the writer lock
+    writer = ShardedIndex.writer
+    raced = []
+
+    def writer_after_other_worker(self):
+        if not raced:
+            raced.append(True)
+            other = ShardedIndex.load(root)
+            with writer(other):
+                _index_chunk(other, session_factory(), 2)
+        return writer(self)
+
+    monkeypatch.setattr(ShardedIndex, "writer", writer_after_other_worker)
+    db = session_factory()
+    assert reconcile_index(db, MODEL) == (0, 0)
+
+    assert raced
+    assert sorted(ShardedIndex.load(root).ids(0).tolist()) == [1, 2]
+    assert sorted(db.scalars(select(ChunkVector.chunk_id)).all()) == [1, 2]
+
+def test_reconcile_deletes_rows_of_a_lost_index(session_factory):
+    db = session_factory()
+    db.add(ChunkVector(chunk_id=1, faiss_id=1, embedding_model=MODEL))
+    db.commit()
+
+    assert reconcile_index(db, MODEL) == (0, 1)
+    assert db.scalars(select(ChunkVector)).all() == []
+
+def test_reconcile_only_keeps_the_active_model_index_loaded(session_factory, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_MODEL", "active-model")
+    db = session_factory()
+    for model_name, chunk_id in ((MODEL, 1), ("active-model", 2)):
+        with ShardedIndex.create(index_dir_for(model_name), dim=8, n_shards=1, storage="flat").writer() as index:
+            index.add(0, _vec(chunk_id), [chunk_id])
+            index.add(0, _vec(9), [9])  # no row: removed by reconcile
+        db.add(ChunkVector(chunk_id=chunk_id, faiss_id=chunk_id, embedding_model=model_name))
+    db.commit()
+
+    indexing.reconcile_indexes(db)
+
+    assert list(faiss_index._indexes) == ["active-model"]
+    for model_name, chunk_id in ((MODEL, 1), ("active-model", 2)):
+        assert ShardedIndex.load(index_dir_for(model_name)).ids(0).tolist() == [chunk_id]
+
+def test_concurrent_legacy_migrations_run_once(session_factory):
+    legacy = faiss_index.legacy_index_path(MODEL)
+    old = faiss.IndexFlatIP(8)
+    old.add(np.vstack([_vec(1), _vec(2)]))
+    faiss.write_index(old, str(legacy))
+    db = session_factory()
+    db.add_all([ChunkVector(chunk_id=c, faiss_id=c - 1, embedding_model=MODEL) for c in (1, 2)])
+    db.commit()
+
+    # every worker runs the startup hook
+    errors = []
+
+    def worker() -> None:
+        try:
+            migrate_legacy_index(session_factory(), MODEL)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert not legacy.exists()
+    index = ShardedIndex.load(index_dir_for(MODEL))
+    assert sorted(i for s in range(index.n_shards) for i in index.ids(s).tolist()) == [1, 2]
+    assert sorted(db.scalars(select(ChunkVector.faiss_id)).all()) == [1, 2]
+
+def test_reembed_fills_a_second_model_without_touching_the_active_one(session_factory, monkeypatch):
+    active = ShardedIndex.create(index_dir_for(MODEL), dim=8, n_shards=1, storage="flat")
+    with active.writer():
+        _index_chunk(active, session_factory(), 1)
+    files = {p.name: p.read_bytes() for p in index_dir_for(MODEL).iterdir()}
+
+    new_model = "new-model"
+    embedded = []
+
+    def fake_embed(texts, model_name):
+        embedded.append(model_name)
+        # another model, another dimension
+        return np.vstack([_vec(len(t)) for t in texts]).repeat(2, axis=1)
+
+    monkeypatch.setattr(indexing, "embed_texts", fake_embed)
+    db = session_factory()
+    assert reembed_all(db, new_model, batch_size=1) == 2
+    assert reembed_all(db, new_model) == 0
+    assert set(embedded) == {new_model}
+
+    new_index = ShardedIndex.load(index_dir_for(new_model))
+    assert new_index.dim == 16
+    assert sorted(i for s in range(new_index.n_shards) for i in new_index.ids(s).tolist()) == [1, 2]
+    rows = db.execute(select(ChunkVector.chunk_id, ChunkVector.embedding_model)).all()
+    assert set(rows) == {(1, MODEL), (1, new_model), (2, new_model)}
+
+    assert {p.name: p.read_bytes() for p in index_dir_for(MODEL).iterdir()} == files
+    assert ShardedIndex.load(index_dir_for(MODEL)).ids(0).tolist() == [1]
+
+def test_reembed_only_accepts_configured_models(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_MODEL", "active-model")
+    monkeypatch.setenv("EMBEDDING_MODELS", "next-model, other-model")
+    started = []
+    monkeypatch.setattr(index_routes, "_running", set())
+    monkeypatch.setattr(index_routes, "_run_reembed", lambda model_name, batch_size: started.append(model_name))
+    client = TestClient(app)
+
+    assert client.post("/v1/index/reembed", json={"model": "someone/any-repo"}).status_code == 400
+    assert client.post("/v1/index/reembed", json={"model": "next-model"}).status_code == 202
+    assert started == ["next-model"]
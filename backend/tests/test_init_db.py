@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.db import init_db as init_db_module
+from app.db.database import Base
+from app.db.init_db import init_db
+from app.db.models import Chunk, ChunkVector, Document
+
+# chunk_vectors as created by versions with one embedding model per chunk
+OLD_CHUNK_VECTORS = [
+    "CREATE TABLE chunk_vectors ("
+    "id INTEGER NOT NULL, chunk_id INTEGER NOT NULL, faiss_id INTEGER NOT NULL, embedding_model VARCHAR NOT NULL, "
+    "PRIMARY KEY (id), CONSTRAINT uq_chunk_vectors_chunk_id UNIQUE (chunk_id), FOREIGN KEY(chunk_id) REFERENCES chunks (id))",
+    "CREATE INDEX ix_chunk_vectors_chunk_id ON chunk_vectors (chunk_id)",
+    "CREATE INDEX ix_chunk_vectors_faiss_id ON chunk_vectors (faiss_id)",
+]
+
+@pytest.fixture()
+def old_engine(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    tables = [t for t in Base.metadata.sorted_tables if t.name != "chunk_vectors"]
+    Base.metadata.create_all(bind=engine, tables=tables)
+    with engine.begin() as conn:
+        for sql in OLD_CHUNK_VECTORS:
+            conn.exec_driver_sql(sql)
+    with Session(engine) as db:
+        db.add(Document(id="doc-0", filename="f.txt", content_type="text/plain", storage_path="x"))
+        db.add_all([Chunk(id=i, document_id="doc-0", chunk_index=i, text=f"chunk {i}") for i in (1, 2)])
+        db.add_all([ChunkVector(chunk_id=i, faiss_id=i, embedding_model="old-model") for i in (1, 2)])
+        db.commit()
+    monkeypatch.setattr(init_db_module, "engine", engine)
+    return engine
+
+def test_upgrade_keeps_rows_and_allows_a_vector_per_model(old_engine):
+    init_db()
+    init_db()  # already upgraded: nothing to do
+
+    with Session(old_engine) as db:
+        rows = db.execute(select(ChunkVector.chunk_id, ChunkVector.faiss_id, ChunkVector.embedding_model)).all()
+        assert sorted(rows) == [(1, 1, "old-model"), (2, 2, "old-model")]
+
+        db.add(ChunkVector(chunk_id=1, faiss_id=1, embedding_model="new-model"))
+        db.commit()
+
+        db.add(ChunkVector(chunk_id=1, faiss_id=1, embedding_model="new-model"))
+        with pytest.raises(IntegrityError):
+            db.commit()
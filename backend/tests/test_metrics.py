@@ -0,0 +1,20 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.metrics import observe_stage, server_timing, start_profile
+
+def test_metrics_endpoint_exposes_prometheus_text():
+    client = TestClient(app)
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "rag_stage_seconds" in response.text
+
+def test_stages_accumulate_into_the_request_profile():
+    profile = start_profile()
+    observe_stage("embed", 0.002)
+    observe_stage("embed", 0.001)
+    observe_stage("ann_search", 0.0005)
+
+    assert server_timing(profile) == "embed;dur=3.0, ann_search;dur=0.5"
@@ -0,0 +1,88 @@
+import datetime as dt
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.api.routes import chat
+from app.api.routes.search import SearchHit, SearchResponse
+from app.services import reranker
+
+class StubCrossEncoder:
+    """
+    Scores a pair with the length of its text; predict() blocks while `gate` is clear.
+    """
+
+    def __init__(self, delay_s: float = 0.0):
+        self.delay_s = delay_s
+        self.calls = 0
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def predict(self, pairs, batch_size=32):
+        self.calls += 1
+        time.sleep(self.delay_s)
+        self.gate.wait(5)
+        return [float(len(text)) for _, text in pairs]
+
+@pytest.fixture()
+def stub(monkeypatch):
+    model = StubCrossEncoder()
+    monkeypatch.setattr(reranker, "get_cross_encoder", lambda model_name: model)
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(reranker, "_get_executor", lambda: executor)
+    monkeypatch.setattr(reranker, "_stragglers", [])
+    yield model
+    model.gate.set()
+    executor.shutdown(wait=True)
+
+def test_scores_within_budget(stub):
+    texts = ["a" * n for n in range(1, 20)]
+    scores, elapsed_ms = reranker.rerank_scores("q", texts, budget_ms=2000, batch_size=4)
+
+    assert scores == [float(n) for n in range(1, 20)]
+    assert stub.calls == 5
+    assert elapsed_ms < 2000
+
+def test_model_load_is_not_counted_in_the_budget(stub, monkeypatch):
+    def slow_load(model_name):
+        time.sleep(0.2)
+        return stub
+
+    monkeypatch.setattr(reranker, "get_cross_encoder", slow_load)
+    scores, elapsed_ms = reranker.rerank_scores("q", ["ab", "c"], budget_ms=100)
+
+    assert scores == [2.0, 1.0]
+    assert elapsed_ms < 100
+
+def test_over_budget_falls_back_and_skips_while_stragglers_run(stub):
+    stub.gate.clear()
+    scores, elapsed_ms = reranker.rerank_scores("q", ["a", "b"], budget_ms=50, batch_size=1)
+    assert scores is None
+    assert elapsed_ms >= 50
+
+    # the pool is still busy with the previous request: don't queue behind it
+    calls = stub.calls
+    assert reranker.rerank_scores("q", ["a", "b"], budget_ms=50) == (None, 0)
+    assert stub.calls == calls
+
+    stub.gate.set()
+    deadline = time.monotonic() + 5
+    while reranker._pool_busy() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    scores, _ = reranker.rerank_scores("q", ["a", "bb"], budget_ms=2000)
+    assert scores == [1.0, 2.0]
+
+def _hit(i: int) -> SearchHit:
+    return SearchHit(score=0.5, chunk_id=i, document_id="doc", filename="f.txt", chunk_index=i,
+                     text=f"chunk {i}", start_char=None, end_char=None, created_at=dt.datetime(2024, 1, 1))
+
+@pytest.mark.parametrize("reranked, expected", [(True, 2), (False, chat.MAX_UNIQUE_HITS)])
+def test_rerank_keep_limits_context_blocks(monkeypatch, reranked, expected):
+    monkeypatch.setenv("RERANK_KEEP", "2")
+    response = SearchResponse(query="q", top_k=8, embedding_model="m", hits=[_hit(i) for i in range(8)],
+                              reranked=reranked)
+    monkeypatch.setattr(chat, "search_chunks", lambda payload, db: response)
+
+    assert [h.chunk_id for h in chat.retrieve("q", 8, db=None).hits] == list(range(expected))
@@ -0,0 +1,44 @@
+from app.services.snippets import compile_query, fold, make_snippet
+
+def test_fold_keeps_positions_and_removes_accents():
+    text = "Modèle Évalué à l'École"
+    assert fold(text) == b"modele evalue a l ecole"
+    assert len(fold(text)) == len(text)
+
+def test_fold_keeps_letters_outside_latin1_in_words():
+    text = "Le cœur — ő"
+    assert fold(text) == b"le c\x80ur   o"
+    assert "cœur du" in make_snippet("x" * 300 + " au cœur du système " + "y" * 300, "cœur", window=40)
+
+def test_accented_query_terms_are_kept_and_match_without_accents():
+    terms = compile_query("Quel modèle pour l'évaluation ?")
+    assert set(terms.weights) == {b"quel", b"modele", b"evaluation"}
+
+    text = "x" * 300 + " le modele retenu " + "y" * 300
+    assert "modele retenu" in make_snippet(text, terms, window=60)
+
+def test_window_with_most_distinct_terms_wins():
+    text = "FAISS " + "filler " * 60 + "FAISS et BM25 ensemble " + "filler " * 60
+    snippet = make_snippet(text, "Comparer FAISS et BM25", window=40)
+
+    assert "FAISS et BM25" in snippet
+    assert snippet.startswith("…") and snippet.endswith("…")
+
+def test_terms_seen_alone_first_still_find_the_window_with_all_of_them():
+    text = "FAISS " + "x" * 400 + " BM25 " + "y" * 400 + " RAG " + "z" * 400 + " FAISS BM25 RAG ensemble " + "w" * 400
+    snippet = make_snippet(text, "FAISS BM25 RAG", window=60)
+
+    assert "FAISS BM25 RAG ensemble" in snippet
+
+def test_terms_match_at_word_start_with_suffixes():
+    text = "fragment " * 40 + "un pipeline RAG simple " + "storage " * 40
+    snippet = make_snippet(text, "RAG", window=40)
+
+    assert "pipeline RAG simple" in snippet
+    assert make_snippet("paragraphe " * 20, "rag", window=20) == ("paragraphe " * 20)[:20] + "…"
+    assert make_snippet(" les modèles retenus ", "Quel modèle ?") == " les modèles retenus "
+    assert "modèles retenus" in make_snippet("x" * 300 + " les modèles retenus " + "y" * 300, "Quel modèle ?", window=40)
+
+def test_fallback_to_text_start_without_match():
+    assert make_snippet("abc " * 100, "zzz", window=20) == ("abc " * 5) + "…"
+    assert make_snippet("court", "zzz") == "court"